@@ -1,16 +1,37 @@
+import argparse
+import hashlib
 import io
 import json
 import logging
+import os
+import platform
+import re
+import shutil
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
 import time
+import weakref
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime
 from json import JSONDecodeError
-from math import ceil
+from math import ceil, floor
 from pathlib import Path
-from typing import Generator, Any, Optional, Union
+from typing import Generator, Any, Callable, Optional, Union, BinaryIO
 
+import pikepdf
 import pymupdf
-from pypdf import PdfReader, PdfWriter, PaperSize, Transformation, PageObject
+from pypdf import PdfReader, PdfWriter, PaperSize, Transformation, PageObject, __version__ as PYPDF_VERSION
 from pypdf.annotations import Line, PolyLine, Rectangle
-from pypdf.generic import RectangleObject, FloatObject, ArrayObject, NameObject
+from pypdf.errors import PyPdfError
+from pypdf.generic import (
+    RectangleObject, FloatObject, ArrayObject, NameObject, DictionaryObject, IndirectObject, StreamObject, PdfObject,
+    ByteStringObject, NumberObject
+)
 from pypdf.papersizes import Dimensions
 
 import wx
@@ -18,7 +39,61 @@ import wx
 
 VERSION = "2.0.0"
 IDEAL_MAX_SIG_SIZE = 4
+POOLED_RESOURCE_TYPES = ("/Font", "/XObject", "/ExtGState")
+INHERITABLE_PAGE_ATTRIBUTES = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+GANG_SHEET_SIZES = {"A3": PaperSize.A3, "A4": PaperSize.A4, "A2": PaperSize.A2}
+STOCK_SIZES = {"A4": PaperSize.A4, "A3": PaperSize.A3, "SRA3": Dimensions(907, 1276), "SRA4": Dimensions(638, 907)}
 SETTINGS_PATH = Path("./settings.json")
+JOBS_PATH = Path("./jobs")
+HISTORY_PATH = Path("./history.sqlite3")
+MEMORY_SAMPLE_SECONDS = 0.05
+PROOF_CHUNKS_PER_WORKER = 4
+# Object numbers reserved for each sheet in deterministic output, so a change to one sheet doesn't renumber the rest
+SHEET_OBJECT_BLOCK = 32
+PROOF_CONTACT_SHEET_COLUMNS = 8
+PROOF_THUMBNAIL_WIDTH = 240
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".jp2", ".jpf", ".jpx")
+# Used for scans that don't record their resolution
+IMAGE_DEFAULT_DPI = 300
+MARK_LENGTH_MM = 5
+MARK_OFFSET_MM = 2
+MARK_LINE_WIDTH = 0.25
+# Trim lines are cut along, so they keep the 1pt stroke they have always had rather than the hairline of the marks
+SIDE_LINE_WIDTH = 1
+COLLATION_MARK_SIZE_MM = (3, 8)
+# How a selection is padded with blank pages to a multiple of 4, and how each is offered to the operator
+PADDING_MODES = {"end": "At End", "before_back_cover": "Before Back Cover", "after_pages": "After Pages"}
+# Input piped in is held in memory up to this size, then spooled to an anonymous temporary file
+STREAM_SPOOL_MAX_BYTES = 64 * 1024 * 1024
+# Speculative imposition waits for the options to settle, so typing into a field starts one run rather than one a key
+SPECULATION_DELAY_MS = 500
+
+# Seconds per page and per MB of source content stream for each stage, from benchmark runs of handbook.pdf
+# (128 pages), a 256 page selection of a 1536 page master and small text-only booklets.
+COST_MODEL = {
+    'lines': (0.00025, 0.0),
+    'signature': (0.0006, 1.8),
+    'double_up': (0.0006, 3.65),
+    'merge': (0.0001, 0.02),
+    'write': (0.0002, 0.09),
+}
+COST_MODEL_BASE_MEMORY_MB = 80
+COST_MODEL_MEMORY_PER_CONTENT_MB = 140
+# Output bytes per byte of source content; imposed pages are written as new, uncompressed content streams.
+COST_MODEL_OUTPUT_PER_CONTENT_BYTE = {'signature': 0.85, 'double_up': 1.9}
+
+
+class ProgressGauge(wx.Gauge):
+    """A gauge that calls on_change, if set, each time its value is set, so a label can follow its progress."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_change: Optional[Callable[[], None]] = None
+
+    def SetValue(self, value: int):
+        super().SetValue(value)
+        if self.on_change is not None:
+            self.on_change()
 
 
 class MainWindow(wx.Frame):
@@ -30,9 +105,12 @@ class MainWindow(wx.Frame):
 
         self.input_document_path = None
         self.output_document_path = None
-        self.pdf_reader = None
-        self.start_page = 0
-        self.end_page = 0
+        self.pdf_reader: Optional[SubsetReader] = None
+        self.page_selection: list[Optional[int]] = []
+        self.preflight_report: Optional[dict[str, Any]] = None
+        self.job_estimate: Optional[dict[str, Any]] = None
+        self.speculative: Optional[SpeculativeImposer] = None
+        self.speculation_timer: Optional[wx.CallLater] = None
 
         self.s_input_sizer = wx.StaticBoxSizer(wx.VERTICAL, root, "Input")
         w_browse_button = wx.Button(root, label="Browse")
@@ -40,11 +118,14 @@ class MainWindow(wx.Frame):
         self.w_input_text = wx.StaticText(root, label="Select input document...")
         s_input_file_select = wx.BoxSizer(wx.HORIZONTAL)
         s_input_file_select.Add(w_browse_button, flag=wx.ALIGN_CENTER_VERTICAL)
+        w_browse_images_button = wx.Button(root, label="Image Folder")
+        w_browse_images_button.Bind(wx.EVT_BUTTON, self.select_input_directory)
+        s_input_file_select.Add(w_browse_images_button, flag=wx.ALIGN_CENTER_VERTICAL | wx.LEFT, border=5)
         s_input_file_select.Add(self.w_input_text, flag=wx.ALIGN_CENTER_VERTICAL | wx.LEFT | wx.RIGHT, border=10)
 
         s_input_pages = wx.BoxSizer(wx.HORIZONTAL)
         s_input_pages.Add(wx.StaticText(root, label="Pages:"), flag=wx.ALIGN_CENTER_VERTICAL)
-        self.w_pages_input = wx.TextCtrl(root, size=wx.Size(50, -1))
+        self.w_pages_input = wx.TextCtrl(root, size=wx.Size(150, -1))
         s_input_pages.Add(self.w_pages_input, flag=wx.ALIGN_CENTER_VERTICAL | wx.LEFT, border=10)
         w_refresh_button = wx.Button(root, label="Update")
         s_input_pages.Add(w_refresh_button, flag=wx.ALIGN_CENTER_VERTICAL | wx.LEFT, border=10)
@@ -53,8 +134,19 @@ class MainWindow(wx.Frame):
         s_input_pages.Add(w_reset_button, flag=wx.ALIGN_CENTER_VERTICAL | wx.LEFT, border=10)
         w_reset_button.Bind(wx.EVT_BUTTON, self.reset_button)
 
+        s_padding = wx.BoxSizer(wx.HORIZONTAL)
+        s_padding.Add(wx.StaticText(root, label="Pad To 4 Pages:"), flag=wx.ALIGN_CENTER_VERTICAL)
+        self.w_padding = wx.Choice(root, choices=list(PADDING_MODES.values()))
+        self.w_padding.SetSelection(0)
+        self.w_padding.Bind(wx.EVT_CHOICE, self.refresh_button)
+        s_padding.Add(self.w_padding, flag=wx.ALIGN_CENTER_VERTICAL | wx.LEFT, border=10)
+        self.w_blank_after = wx.TextCtrl(root, size=wx.Size(100, -1))
+        self.w_blank_after.SetToolTip("Pages to put a blank after, e.g. '0, 12', used with After Pages")
+        s_padding.Add(self.w_blank_after, flag=wx.ALIGN_CENTER_VERTICAL | wx.LEFT, border=10)
+
         self.s_input_sizer.Add(s_input_file_select)
         self.s_input_sizer.Add(s_input_pages, flag=wx.TOP, border=10)
+        self.s_input_sizer.Add(s_padding, flag=wx.TOP, border=10)
 
         s_signatures = wx.StaticBoxSizer(wx.VERTICAL, root, "Signatures")
         s_num_signatures = wx.BoxSizer(wx.HORIZONTAL)
@@ -86,13 +178,29 @@ class MainWindow(wx.Frame):
             flag=wx.ALIGN_CENTER_VERTICAL | wx.ALIGN_RIGHT
         )
         self.w_add_lines = wx.CheckBox(root)
+        self.w_add_lines.Bind(wx.EVT_CHECKBOX, self.update_preflight)
         s_options_grid.Add(self.w_add_lines, (0, 1), flag=wx.ALIGN_CENTER_VERTICAL | wx.ALIGN_LEFT)
+        self.w_marks: dict[str, wx.CheckBox] = {}
+        for row, (mark, label) in enumerate(
+                (('crop', "Crop Marks:"), ('fold', "Fold Marks:"), ('collation', "Collation Marks:"),
+                 ('border', "Page Borders:")),
+                start=1
+        ):
+            s_options_grid.Add(
+                wx.StaticText(root, label=label),
+                (row, 0),
+                flag=wx.ALIGN_CENTER_VERTICAL | wx.ALIGN_RIGHT
+            )
+            self.w_marks[mark] = wx.CheckBox(root)
+            self.w_marks[mark].Bind(wx.EVT_CHECKBOX, self.update_preflight)
+            s_options_grid.Add(self.w_marks[mark], (row, 1), flag=wx.ALIGN_CENTER_VERTICAL | wx.ALIGN_LEFT)
         s_options_grid.Add(
             wx.StaticText(root, label="Double Up:"),
             (0, 3),
             flag=wx.ALIGN_CENTER_VERTICAL | wx.ALIGN_RIGHT
         )
         self.w_double_up = wx.CheckBox(root)
+        self.w_double_up.Bind(wx.EVT_CHECKBOX, self.update_preflight)
         s_options_grid.Add(self.w_double_up, (0, 4), flag=wx.ALIGN_CENTER_VERTICAL | wx.ALIGN_LEFT)
         s_options_grid.Add(
             wx.StaticText(root, label="Double Up Page Height:"),
@@ -100,18 +208,57 @@ class MainWindow(wx.Frame):
             flag=wx.ALIGN_CENTER_VERTICAL | wx.ALIGN_RIGHT
         )
         self.w_double_up_page_height = wx.SpinCtrlDouble(root, value="100", inc=0.1, max=999)
+        self.w_double_up_page_height.Bind(wx.EVT_SPINCTRLDOUBLE, self.update_preflight)
         s_options_grid.Add(self.w_double_up_page_height, (1, 4), flag=wx.ALIGN_CENTER_VERTICAL | wx.ALIGN_LEFT)
         s_options_grid.Add(
             wx.StaticText(root, label="mm"),
             (1, 5),
             flag=wx.ALIGN_CENTER_VERTICAL | wx.ALIGN_LEFT
         )
+        s_options_grid.Add(
+            wx.StaticText(root, label="Cut and Stack:"),
+            (3, 3),
+            flag=wx.ALIGN_CENTER_VERTICAL | wx.ALIGN_RIGHT
+        )
+        self.w_cut_and_stack = wx.CheckBox(root)
+        self.w_cut_and_stack.Bind(wx.EVT_CHECKBOX, self.update_preflight)
+        s_options_grid.Add(self.w_cut_and_stack, (3, 4), flag=wx.ALIGN_CENTER_VERTICAL | wx.ALIGN_LEFT)
+        s_options_grid.Add(
+            wx.StaticText(root, label="Optimise Sheet:"),
+            (4, 3),
+            flag=wx.ALIGN_CENTER_VERTICAL | wx.ALIGN_RIGHT
+        )
+        self.w_optimise_sheet = wx.CheckBox(root)
+        self.w_optimise_sheet.Bind(wx.EVT_CHECKBOX, self.update_preflight)
+        s_options_grid.Add(self.w_optimise_sheet, (4, 4), flag=wx.ALIGN_CENTER_VERTICAL | wx.ALIGN_LEFT)
+        s_options_grid.Add(
+            wx.StaticText(root, label="Stock Sizes:"),
+            (5, 3),
+            flag=wx.ALIGN_CENTER_VERTICAL | wx.ALIGN_RIGHT
+        )
+        self.w_stock_sizes = wx.TextCtrl(root, value="A4, A3, SRA3", size=wx.Size(150, -1))
+        self.w_stock_sizes.Bind(wx.EVT_TEXT, self.update_preflight)
+        s_options_grid.Add(self.w_stock_sizes, (5, 4), span=(1, 2), flag=wx.ALIGN_CENTER_VERTICAL | wx.ALIGN_LEFT)
+        s_options_grid.Add(
+            wx.StaticText(root, label="Sheet Margin:"),
+            (6, 3),
+            flag=wx.ALIGN_CENTER_VERTICAL | wx.ALIGN_RIGHT
+        )
+        self.w_sheet_margin = wx.SpinCtrlDouble(root, value="5", min=0, inc=0.5, max=99)
+        self.w_sheet_margin.Bind(wx.EVT_SPINCTRLDOUBLE, self.update_preflight)
+        s_options_grid.Add(self.w_sheet_margin, (6, 4), flag=wx.ALIGN_CENTER_VERTICAL | wx.ALIGN_LEFT)
+        s_options_grid.Add(
+            wx.StaticText(root, label="mm"),
+            (6, 5),
+            flag=wx.ALIGN_CENTER_VERTICAL | wx.ALIGN_LEFT
+        )
         s_options_grid.Add(
             wx.StaticText(root, label="Double Up Center Margin:"),
             (2, 3),
             flag=wx.ALIGN_CENTER_VERTICAL | wx.ALIGN_RIGHT
         )
         self.w_double_up_centre_margin = wx.SpinCtrlDouble(root, value="-1", min=-1, inc=0.5, max=99)
+        self.w_double_up_centre_margin.Bind(wx.EVT_SPINCTRLDOUBLE, self.update_preflight)
         s_options_grid.Add(self.w_double_up_centre_margin, (2, 4), flag=wx.ALIGN_CENTER_VERTICAL | wx.ALIGN_LEFT)
         s_options_grid.Add(
             wx.StaticText(root, label="mm (-1 will auto margin)"),
@@ -120,6 +267,10 @@ class MainWindow(wx.Frame):
         )
         s_options.Add(s_options_grid, flag=wx.EXPAND)
 
+        s_preflight = wx.StaticBoxSizer(wx.VERTICAL, root, "Preflight")
+        self.w_preflight_text = wx.StaticText(root, label="Select input document...")
+        s_preflight.Add(self.w_preflight_text)
+
         s_output = wx.StaticBoxSizer(wx.VERTICAL, root, "Output")
         w_output_browse_button = wx.Button(root, label="Browse")
         w_output_browse_button.Bind(wx.EVT_BUTTON, self.select_output_path)
@@ -136,12 +287,78 @@ class MainWindow(wx.Frame):
         self.w_save_sigs_separately = wx.CheckBox(root)
         s_save_sigs_separately.Add(self.w_save_sigs_separately, flag=wx.ALIGN_CENTER_VERTICAL | wx.LEFT, border=5)
         s_output.Add(s_save_sigs_separately, flag=wx.TOP, border=10)
+        s_split_volumes = wx.BoxSizer(wx.HORIZONTAL)
+        s_split_volumes.Add(
+            wx.StaticText(root, label="Split Into Volumes:"),
+            wx.ALIGN_CENTER_VERTICAL | wx.RIGHT | wx.LEFT, border=10
+        )
+        self.w_split_volumes = wx.CheckBox(root)
+        s_split_volumes.Add(self.w_split_volumes, flag=wx.ALIGN_CENTER_VERTICAL | wx.LEFT, border=5)
+        self.w_volume_max_mb = wx.SpinCtrl(root, value="0", min=0, max=100000, size=wx.Size(70, -1))
+        s_split_volumes.Add(self.w_volume_max_mb, flag=wx.ALIGN_CENTER_VERTICAL | wx.LEFT, border=10)
+        s_split_volumes.Add(wx.StaticText(root, label="MB"), flag=wx.ALIGN_CENTER_VERTICAL | wx.LEFT, border=5)
+        self.w_volume_max_sheets = wx.SpinCtrl(root, value="0", min=0, max=10000, size=wx.Size(70, -1))
+        s_split_volumes.Add(self.w_volume_max_sheets, flag=wx.ALIGN_CENTER_VERTICAL | wx.LEFT, border=10)
+        s_split_volumes.Add(
+            wx.StaticText(root, label="sheets (0 for no limit)"),
+            flag=wx.ALIGN_CENTER_VERTICAL | wx.LEFT,
+            border=5
+        )
+        s_output.Add(s_split_volumes, flag=wx.TOP, border=10)
+        s_linearize = wx.BoxSizer(wx.HORIZONTAL)
+        s_linearize.Add(
+            wx.StaticText(root, label="Linearise Output:"),
+            wx.ALIGN_CENTER_VERTICAL | wx.RIGHT | wx.LEFT, border=10
+        )
+        self.w_linearize = wx.CheckBox(root)
+        s_linearize.Add(self.w_linearize, flag=wx.ALIGN_CENTER_VERTICAL | wx.LEFT, border=5)
+        s_output.Add(s_linearize, flag=wx.TOP, border=10)
+        s_deterministic = wx.BoxSizer(wx.HORIZONTAL)
+        s_deterministic.Add(
+            wx.StaticText(root, label="Deterministic Output:"),
+            wx.ALIGN_CENTER_VERTICAL | wx.RIGHT | wx.LEFT, border=10
+        )
+        self.w_deterministic = wx.CheckBox(root)
+        s_deterministic.Add(self.w_deterministic, flag=wx.ALIGN_CENTER_VERTICAL | wx.LEFT, border=5)
+        s_output.Add(s_deterministic, flag=wx.TOP, border=10)
+        s_subset_fonts = wx.BoxSizer(wx.HORIZONTAL)
+        s_subset_fonts.Add(
+            wx.StaticText(root, label="Subset Fonts:"),
+            wx.ALIGN_CENTER_VERTICAL | wx.RIGHT | wx.LEFT, border=10
+        )
+        self.w_subset_fonts = wx.CheckBox(root)
+        s_subset_fonts.Add(self.w_subset_fonts, flag=wx.ALIGN_CENTER_VERTICAL | wx.LEFT, border=5)
+        s_output.Add(s_subset_fonts, flag=wx.TOP, border=10)
+        s_proofs = wx.BoxSizer(wx.HORIZONTAL)
+        s_proofs.Add(
+            wx.StaticText(root, label="Export Proofs:"),
+            wx.ALIGN_CENTER_VERTICAL | wx.RIGHT | wx.LEFT, border=10
+        )
+        self.w_export_proofs = wx.CheckBox(root)
+        s_proofs.Add(self.w_export_proofs, flag=wx.ALIGN_CENTER_VERTICAL | wx.LEFT, border=5)
+        self.w_proof_dpi = wx.SpinCtrl(root, value="72", min=10, max=600, size=wx.Size(60, -1))
+        s_proofs.Add(self.w_proof_dpi, flag=wx.ALIGN_CENTER_VERTICAL | wx.LEFT, border=10)
+        s_proofs.Add(wx.StaticText(root, label="dpi"), flag=wx.ALIGN_CENTER_VERTICAL | wx.LEFT, border=5)
+        s_output.Add(s_proofs, flag=wx.TOP, border=10)
 
         self.w_start_process = wx.Button(root, label="Start Process")
         self.w_start_process.Disable()
         self.w_start_process.Bind(wx.EVT_BUTTON, self.process_document)
-
-        self.w_progress_bar = wx.Gauge(root, range=100)
+        self.w_reprint = wx.Button(root, label="Reprint...")
+        self.w_reprint.Disable()
+        self.w_reprint.Bind(wx.EVT_BUTTON, self.reprint_sheets)
+        w_gang_booklets = wx.Button(root, label="Gang Booklets...")
+        w_gang_booklets.Bind(wx.EVT_BUTTON, self.gang_booklets)
+        s_actions = wx.BoxSizer(wx.HORIZONTAL)
+        s_actions.Add(self.w_start_process)
+        s_actions.Add(self.w_reprint, flag=wx.LEFT, border=10)
+        s_actions.Add(w_gang_booklets, flag=wx.LEFT, border=10)
+
+        self.w_progress_bar = ProgressGauge(root, range=100)
+        self.w_progress_bar.on_change = self.update_progress_label
+        self.progress_label = ""
+        self.progress_stages: tuple[str, ...] = ()
+        self.progress_start = 0
         self.w_progress_text = wx.StaticText(root, label="foo", style=wx.ALIGN_CENTER)
         self.w_progress_bar.Hide()
         self.w_progress_text.Hide()
@@ -150,8 +367,9 @@ class MainWindow(wx.Frame):
         self.s_main.Add(self.s_input_sizer, flag=wx.EXPAND | wx.ALL, border=10)
         self.s_main.Add(s_signatures, flag=wx.EXPAND | wx.LEFT | wx.RIGHT | wx.BOTTOM, border=10)
         self.s_main.Add(s_options, flag=wx.EXPAND | wx.LEFT | wx.RIGHT | wx.BOTTOM, border=10)
+        self.s_main.Add(s_preflight, flag=wx.EXPAND | wx.LEFT | wx.RIGHT | wx.BOTTOM, border=10)
         self.s_main.Add(s_output, flag=wx.EXPAND | wx.LEFT | wx.RIGHT | wx.BOTTOM, border=10)
-        self.s_main.Add(self.w_start_process, flag=wx.ALIGN_CENTER | wx.LEFT | wx.RIGHT | wx.BOTTOM, border=10)
+        self.s_main.Add(s_actions, flag=wx.ALIGN_CENTER | wx.LEFT | wx.RIGHT | wx.BOTTOM, border=10)
         self.s_main.Add(self.w_progress_bar, flag=wx.EXPAND | wx.LEFT | wx.RIGHT | wx.BOTTOM, border=10)
         self.s_main.Add(self.w_progress_text, flag=wx.EXPAND | wx.LEFT | wx.RIGHT | wx.BOTTOM, border=10)
 
@@ -167,10 +385,26 @@ class MainWindow(wx.Frame):
             with SETTINGS_PATH.open("r") as fh:
                 settings_data = json.load(fh)
             self.w_add_lines.SetValue(settings_data['add_side_lines'])
+            self.w_padding.SetSelection(list(PADDING_MODES).index(settings_data.get('padding', "end")))
+            self.w_blank_after.ChangeValue(settings_data.get('blank_after', ""))
             self.w_double_up.SetValue(settings_data['double_up'])
             self.w_double_up_page_height.SetValue(settings_data['double_up_height'])
             self.w_double_up_centre_margin.SetValue(settings_data['double_up_margin'])
             self.w_save_sigs_separately.SetValue(settings_data['save_signatures_separately'])
+            self.w_cut_and_stack.SetValue(settings_data.get('cut_and_stack', False))
+            self.w_optimise_sheet.SetValue(settings_data.get('optimise_sheet', False))
+            self.w_stock_sizes.ChangeValue(settings_data.get('stock_sizes', "A4, A3, SRA3"))
+            self.w_sheet_margin.SetValue(settings_data.get('sheet_margin', 5))
+            for mark, checkbox in self.w_marks.items():
+                checkbox.SetValue(settings_data.get('marks', {}).get(mark, False))
+            self.w_split_volumes.SetValue(settings_data.get('split_volumes', False))
+            self.w_volume_max_mb.SetValue(settings_data.get('volume_max_mb', 0))
+            self.w_volume_max_sheets.SetValue(settings_data.get('volume_max_sheets', 0))
+            self.w_linearize.SetValue(settings_data.get('linearize_output', False))
+            self.w_deterministic.SetValue(settings_data.get('deterministic_output', False))
+            self.w_subset_fonts.SetValue(settings_data.get('subset_fonts', False))
+            self.w_export_proofs.SetValue(settings_data.get('export_proofs', False))
+            self.w_proof_dpi.SetValue(settings_data.get('proof_dpi', 72))
 
         except FileNotFoundError:
             logging.debug("No settings file")
@@ -181,10 +415,25 @@ class MainWindow(wx.Frame):
         try:
             settings_data = {
                 'add_side_lines': self.w_add_lines.GetValue(),
+                'padding': list(PADDING_MODES)[self.w_padding.GetSelection()],
+                'blank_after': self.w_blank_after.GetValue(),
                 'double_up': self.w_double_up.GetValue(),
                 'double_up_height': self.w_double_up_page_height.GetValue(),
                 'double_up_margin': self.w_double_up_centre_margin.GetValue(),
-                'save_signatures_separately': self.w_save_sigs_separately.GetValue()
+                'save_signatures_separately': self.w_save_sigs_separately.GetValue(),
+                'cut_and_stack': self.w_cut_and_stack.GetValue(),
+                'optimise_sheet': self.w_optimise_sheet.GetValue(),
+                'stock_sizes': self.w_stock_sizes.GetValue(),
+                'sheet_margin': self.w_sheet_margin.GetValue(),
+                'marks': {mark: checkbox.GetValue() for mark, checkbox in self.w_marks.items()},
+                'split_volumes': self.w_split_volumes.GetValue(),
+                'volume_max_mb': self.w_volume_max_mb.GetValue(),
+                'volume_max_sheets': self.w_volume_max_sheets.GetValue(),
+                'linearize_output': self.w_linearize.GetValue(),
+                'deterministic_output': self.w_deterministic.GetValue(),
+                'subset_fonts': self.w_subset_fonts.GetValue(),
+                'export_proofs': self.w_export_proofs.GetValue(),
+                'proof_dpi': self.w_proof_dpi.GetValue()
             }
             with open(SETTINGS_PATH, "w") as fh:
                 # noinspection PyTypeChecker
@@ -195,30 +444,38 @@ class MainWindow(wx.Frame):
 
     def refresh_button(self, _=None):
         if self.pdf_reader is not None:
-            new_start, new_end = get_page_range_numbers(self.w_pages_input.GetValue(), self.pdf_reader.get_num_pages())
-            new_num = new_end - new_start + 1
-            if new_num % 4 != 0:
+            try:
+                new_selection = self.pad_selection(
+                    parse_page_selection(self.w_pages_input.GetValue(), self.pdf_reader.get_num_pages())
+                )
+            except ValueError as e:
                 dlg = wx.MessageDialog(
                     self,
-                    f"Input page range must have a number of pages divisible by 4, has {new_num}.",
+                    f"Could not read page selection: {e}",
                     "Bad Page Range",
                     wx.OK | wx.ICON_WARNING | wx.CENTER
                 )
                 dlg.ShowModal()
-            else:
-                self.start_page = new_start
-                self.end_page = new_end
-                self.input_pages_changed()
+                return
+            self.page_selection = new_selection
+            self.input_pages_changed()
+
+    def pad_selection(self, selection: list[int]) -> list[Optional[int]]:
+        """Pad a page selection to a multiple of 4 pages as the padding options say."""
+        mode = list(PADDING_MODES)[self.w_padding.GetSelection()]
+        if mode == "after_pages":
+            after_pages = parse_blank_positions(self.w_blank_after.GetValue(), len(selection))
+            return pad_page_selection(selection, mode, after_pages)
+        return pad_page_selection(selection, mode)
 
     def reset_button(self, _=None):
         if self.pdf_reader is not None:
-            self.start_page = 1
-            self.end_page = self.pdf_reader.get_num_pages()
-            self.w_pages_input.ChangeValue(f"1-{self.end_page}")
+            self.page_selection = list(range(self.pdf_reader.get_num_pages()))
+            self.w_pages_input.ChangeValue(f"1-{self.pdf_reader.get_num_pages()}")
             self.refresh_button()
 
     def get_num_pages(self):
-        return (self.end_page - self.start_page) + 1
+        return len(self.page_selection)
 
     def select_input_path(self, _):
         if self.input_document_path:
@@ -239,13 +496,31 @@ class MainWindow(wx.Frame):
 
             file_path = fileDialog.GetPath()
 
-        self.w_input_text.SetLabelText(file_path)
-        self.input_document_path = file_path
+        self.set_input_path(file_path)
+
+    def select_input_directory(self, _):
+        with wx.DirDialog(
+                self,
+                message="Open folder of page images",
+                defaultPath=str(Path(self.input_document_path).parent) if self.input_document_path else "",
+                style=wx.DD_DIR_MUST_EXIST
+        ) as dirDialog:
+            if dirDialog.ShowModal() == wx.ID_CANCEL:
+                return
+            dir_path = dirDialog.GetPath()
+
+        self.set_input_path(dir_path)
+
+    def set_input_path(self, path: str):
+        self.w_input_text.SetLabelText(path)
+        self.input_document_path = path
         self.read_input_file()
         if self.input_document_path and self.output_document_path:
             self.w_start_process.Enable()
+            self.w_reprint.Enable()
         else:
             self.w_start_process.Disable()
+            self.w_reprint.Disable()
 
     def select_output_path(self, _):
         if self.output_document_path:
@@ -273,14 +548,17 @@ class MainWindow(wx.Frame):
         self.output_document_path = file_path
         if self.input_document_path and self.output_document_path:
             self.w_start_process.Enable()
+            self.w_reprint.Enable()
         else:
             self.w_start_process.Disable()
+            self.w_reprint.Disable()
         self.s_main.Fit(self)
         self.Update()
 
     def number_of_sig_changes(self, e):
         if self.pdf_reader is not None:
             self.update_sig_spins(e.Int)
+            self.update_preflight()
 
     def update_sig_spins(self, n: int):
         self.s_sig_spins.Clear(True)
@@ -290,7 +568,7 @@ class MainWindow(wx.Frame):
 
         for w in self.sig_spins:
             self.s_sig_spins.Add(w)
-            # TODO: Add bind
+            w.Bind(wx.EVT_SPINCTRL, self.update_preflight)
 
         self.s_main.Fit(self)
         self.s_main.Layout()
@@ -298,32 +576,148 @@ class MainWindow(wx.Frame):
     def input_pages_changed(self):
         num_sigs = get_ideal_num_sigs(self.get_num_pages())
         self.w_num_signatures.SetValue(num_sigs)
-        self.w_signatures_label.SetLabelText(f"({self.get_num_pages() // 4} sheets)")
+        blank_pages = self.page_selection.count(None)
+        self.w_signatures_label.SetLabelText(
+            f"({self.get_num_pages() // 4} sheets, {blank_pages} blank pages)" if blank_pages
+            else f"({self.get_num_pages() // 4} sheets)"
+        )
         self.update_sig_spins(n=num_sigs)
         self.w_num_signatures.Enable()
+        try:
+            self.preflight_report = preflight(self.input_document_path, self.page_selection)
+        except ValueError as e:
+            logging.warning(f"Preflight failed: {e}")
+            self.preflight_report = None
+        self.update_preflight()
+
+    def update_preflight(self, event: Optional[wx.Event] = None):
+        if self.preflight_report is not None:
+            self.job_estimate = estimate_job_cost(
+                self.preflight_report,
+                add_side_lines=self.w_add_lines.GetValue(),
+                double_up_height_mm=self.w_double_up_page_height.GetValue() if self.w_double_up.GetValue() else None
+            )
+            preflight_text = format_preflight(self.preflight_report, self.job_estimate)
+            if self.w_optimise_sheet.GetValue():
+                layout = self.plan_layout()
+                preflight_text += "\n" + (
+                    format_sheet_layout(layout) if layout is not None else "No stock size fits a signature sheet"
+                )
+            self.w_preflight_text.SetLabelText(preflight_text)
+            self.s_main.Fit(self)
+            self.speculate()
+        if event is not None:
+            event.Skip()
+
+    def plan_layout(self) -> Optional[dict[str, Any]]:
+        """The optimised sheet layout for the current options, or None if none fits or the stock sizes are invalid."""
+        try:
+            stock_sizes = parse_stock_sizes(self.w_stock_sizes.GetValue())
+        except ValueError:
+            return None
+        page_size = self.pdf_reader.subset(self.page_selection).pages[0].mediabox
+        if self.w_double_up.GetValue():
+            scale = mm_to_pnt(self.w_double_up_page_height.GetValue()) / float(page_size.height)
+        else:
+            scale = 1
+        return plan_sheet_layout(
+            (2 * float(page_size.width), float(page_size.height)),
+            [s.GetValue() for s in self.sig_spins],
+            stock_sizes,
+            margin_mm=self.w_sheet_margin.GetValue(),
+            scale=scale,
+            cut_and_stack=self.w_cut_and_stack.GetValue()
+        )
+
+    def job_plan(self) -> dict[str, Any]:
+        """
+        The imposition the current options describe, as the arguments to impose_signatures, and the size of the first
+        selected page, which create_signature sizes every sheet from.
+        """
+        layout = self.plan_layout() if self.w_optimise_sheet.GetValue() else None
+        first_page_box = self.pdf_reader.subset(self.page_selection).pages[0].mediabox
+        return {
+            'pages': list(self.page_selection),
+            'page_size': (float(first_page_box.width), float(first_page_box.height)),
+            'signature_sizes': [s.GetValue() for s in self.sig_spins],
+            'add_side_lines': self.w_add_lines.GetValue(),
+            'double_up_height_mm': self.w_double_up_page_height.GetValue() if self.w_double_up.GetValue() else None,
+            'center_margin_mm': None if self.w_double_up_centre_margin.GetValue() < 0
+            else self.w_double_up_centre_margin.GetValue(),
+            'cut_and_stack': (self.w_double_up.GetValue() or layout is not None) and self.w_cut_and_stack.GetValue(),
+            'layout': layout,
+            'marks': {mark: checkbox.GetValue() for mark, checkbox in self.w_marks.items()}
+        }
+
+    def speculate(self):
+        """Impose the current plan in the background once the options settle, in case the operator starts it as is."""
+        if self.speculation_timer is not None:
+            self.speculation_timer.Stop()
+        self.speculation_timer = wx.CallLater(SPECULATION_DELAY_MS, self.start_speculation)
+
+    def start_speculation(self):
+        self.speculation_timer = None
+        if self.speculative is not None and sum(s.GetValue() for s in self.sig_spins) * 4 == self.get_num_pages():
+            self.speculative.start(self.job_plan())
+
+    def set_progress_stage(self, label: str, stages: tuple[str, ...] = ()):
+        """Show the part of the job under way, and how long is left of the stages of the cost model it covers."""
+        self.progress_label = label
+        self.progress_stages = stages
+        self.progress_start = self.w_progress_bar.GetValue()
+        self.update_progress_label()
+
+    def update_progress_label(self):
+        """
+        Refresh the time left as the gauge moves: the estimate for the stages under way, less the fraction of the
+        gauge done since they started, and the estimates for every stage after them.
+        """
+        label = self.progress_label
+        stage_seconds = self.job_estimate['stage_seconds'] if self.job_estimate is not None else {}
+        current = [stage for stage in self.progress_stages if stage in stage_seconds]
+        if current:
+            steps = self.w_progress_bar.GetRange() - self.progress_start
+            done = min((self.w_progress_bar.GetValue() - self.progress_start) / steps, 1) if steps > 0 else 0
+            stages = list(stage_seconds)
+            later = stages[max(stages.index(stage) for stage in current) + 1:]
+            remaining = (1 - done) * sum(stage_seconds[s] for s in current) + sum(stage_seconds[s] for s in later)
+            label = f"{label} (about {remaining:.0f}s left)"
+        if label != self.w_progress_text.GetLabelText():
+            self.w_progress_text.SetLabelText(label)
 
     def read_input_file(self):
         if self.input_document_path:
-            self.pdf_reader = PdfReader(self.input_document_path)
+            if self.pdf_reader is not None:
+                self.pdf_reader.close()
+            if self.speculative is not None:
+                self.speculative.cancel()
+                self.speculative = None
+            self.pdf_reader = open_input(self.input_document_path)
             num_pages = self.pdf_reader.get_num_pages()
-
-            if num_pages % 4 == 0:
-                self.w_pages_input.ChangeValue(f"{1}-{num_pages}")
-                self.start_page = 1
-                self.end_page = self.pdf_reader.get_num_pages()
-                self.input_pages_changed()
-            else:
+            if num_pages == 0:
+                is_dir = isinstance(self.pdf_reader, ImageDirectoryReader)
                 dlg = wx.MessageDialog(
                     self,
-                    f"Input PDF must have a number of pages divisible by 4, has {num_pages}.",
-                    "Bad File",
+                    "The folder has no JPEG or JPEG 2000 page images." if is_dir else "The input PDF has no pages.",
+                    "Bad Folder" if is_dir else "Bad File",
                     wx.OK | wx.ICON_WARNING | wx.CENTER
                 )
                 dlg.ShowModal()
 
+                self.pdf_reader.close()
                 self.pdf_reader = None
                 self.input_document_path = ""
                 self.w_input_text.SetLabelText("Select input document...")
+                return
+
+            self.w_pages_input.ChangeValue(f"{1}-{num_pages}")
+            try:
+                self.page_selection = self.pad_selection(list(range(num_pages)))
+            except ValueError as e:
+                logging.warning(f"Padding at the end instead: {e}")
+                self.page_selection = pad_page_selection(list(range(num_pages)))
+            self.speculative = SpeculativeImposer(self.input_document_path)
+            self.input_pages_changed()
         else:
             logging.error(f"Cannot read input file, input path is {repr(self.input_document_path)}")
 
@@ -354,127 +748,1960 @@ class MainWindow(wx.Frame):
             dlg.ShowModal()
             return
 
+        self.w_progress_bar.SetValue(0)
         self.w_progress_bar.Show()
         self.w_progress_text.Show()
         self.w_start_process.Disable()
         self.s_main.Fit(self)
 
-        if self.w_add_lines.GetValue():
-            self.pdf_reader = add_lines(self.pdf_reader, self.end_page - 1)
+        job_start = time.perf_counter()
+        timer = StageTimer()
+        memory = PeakMemoryMonitor()
+        memory.start()
+        plan = self.job_plan()
+        sig_sizes = plan['signature_sizes']
+        layout = plan['layout']
+        job_settings = {
+            'pages': self.page_selection,
+            'signature_sizes': sig_sizes,
+            'add_side_lines': self.w_add_lines.GetValue(),
+            'double_up': self.w_double_up.GetValue(),
+            'double_up_height': self.w_double_up_page_height.GetValue(),
+            'double_up_margin': plan['center_margin_mm'],
+            'cut_and_stack': self.w_cut_and_stack.GetValue(),
+            'layout': {
+                'stock_sizes': self.w_stock_sizes.GetValue(), 'margin': self.w_sheet_margin.GetValue()
+            } if self.w_optimise_sheet.GetValue() else None,
+            'marks': plan['marks']
+        }
+        with timer.stage("fingerprint_input"):
+            checkpoint = JobCheckpoint.for_input(self.pdf_reader, job_settings)
+
+        if layout is not None:
+            impose_label = "Imposing signatures onto press sheets..."
+        elif self.w_double_up.GetValue():
+            impose_label = "Imposing and doubling up signatures..."
+        else:
+            impose_label = "Imposing signatures..."
+        # Signatures are imposed as they are merged, or as each file is written when the output is split up
+        impose_stages = ("lines", "signature", "double_up", "merge")
+        if self.w_save_sigs_separately.GetValue() or self.w_split_volumes.GetValue():
+            impose_stages += ("write",)
+        self.set_progress_stage(impose_label, impose_stages)
+        with timer.stage("speculation"):
+            if self.speculation_timer is not None:
+                self.speculation_timer.Stop()
+                self.speculation_timer = None
+            if self.speculative is not None:
+                imposed, prepared = self.speculative.take(plan)
+            else:
+                imposed, prepared = None, {}
+
+        reader = self.pdf_reader.subset(self.page_selection)
+        signatures_needed = imposed is None and len(prepared) < len(sig_sizes) \
+            and not checkpoint.is_complete("signature", len(sig_sizes))
+        if self.w_add_lines.GetValue() and signatures_needed:
+            with timer.stage("lines"):
+                reader = add_lines_to_last_page(reader)
 
-        self.w_progress_text.SetLabelText("Creating signatures...")
         total_sides = self.get_num_pages() // 2
-        self.w_progress_bar.SetRange(total_sides)
+        if self.w_optimise_sheet.GetValue() and layout is None:
+            dlg = wx.MessageDialog(
+                self,
+                "None of the stock sizes fit a signature sheet, printing without sheet optimisation.",
+                "No Sheet Layout",
+                wx.OK | wx.ICON_WARNING | wx.CENTER
+            )
+            dlg.ShowModal()
+        if layout is not None or self.w_double_up.GetValue():
+            ways = 2 if layout is None else layout['columns'] * layout['rows']
+            groups = plan_cut_and_stack(sig_sizes, ways) if plan['cut_and_stack'] \
+                else [(i,) for i in range(len(sig_sizes))]
+            placed_sides = sum(2 * max(sig_sizes[i] for i in group if i is not None) for group in groups)
+            self.w_progress_bar.SetRange(total_sides + placed_sides)
+        else:
+            self.w_progress_bar.SetRange(total_sides)
+        if imposed is not None:
+            logging.info("Using the speculatively imposed signatures")
+            self.w_progress_bar.SetValue(self.w_progress_bar.GetRange())
+            signatures = iter(imposed)
+        else:
+            signatures = impose_signatures(
+                reader,
+                sig_sizes,
+                checkpoint=checkpoint,
+                double_up_height_mm=plan['double_up_height_mm'],
+                center_margin_mm=plan['center_margin_mm'],
+                cut_and_stack=plan['cut_and_stack'],
+                layout=layout,
+                marks=SheetMarks(**plan['marks']),
+                prepared=prepared,
+                timer=timer,
+                progress_bar=self.w_progress_bar
+            )
 
-        sig_sizes = [s.GetValue() for s in self.sig_spins]
-        signatures: list[PdfWriter] = []
-        for page_range in get_signature_page_indexes(sig_sizes, self.start_page - 1):
-            signatures.append(
-                create_signature(
-                    self.pdf_reader,
-                    page_range,
-                    self.w_progress_bar
+        if self.w_deterministic.GetValue():
+            resource_pool = ResourcePool(sheet_object_block=SHEET_OBJECT_BLOCK)
+            with timer.stage("fingerprint_input"):
+                document_id = content_document_id(self.pdf_reader.subset(self.page_selection), job_settings)
+        else:
+            resource_pool = ResourcePool()
+            document_id = None
+        output_paths: list[str] = []
+        write_start = time.perf_counter()
+
+        with timer.stage("write"):
+            if self.w_save_sigs_separately.GetValue():
+                for i, s in enumerate(signatures):
+                    file_name, ext = self.output_document_path.rsplit(".", 1)
+                    output_paths.append(file_name + f"_{i}." + ext)
+                    with open(output_paths[-1], "bw") as fh:
+                        writer = PdfWriter()
+                        for page in s.pages:
+                            resource_pool.insert_page(writer, page)
+                        write_pdf(
+                            writer,
+                            fh,
+                            linearize=self.w_linearize.GetValue(),
+                            document_id=part_document_id(document_id, f"signature_{i}")
+                        )
+                        writer.close()
+            elif self.w_split_volumes.GetValue():
+                volumes = VolumeWriter(
+                    self.output_document_path,
+                    max_bytes=self.w_volume_max_mb.GetValue() * 1_000_000 or None,
+                    max_sheets=self.w_volume_max_sheets.GetValue() or None,
+                    linearize=self.w_linearize.GetValue(),
+                    document_id=document_id,
+                    resource_pool=resource_pool
                 )
-            )
+                for s in signatures:
+                    volumes.add(s)
+                volumes.close()
+                output_paths.extend(volumes.paths)
+            else:
+                merger = PdfWriter()
+                for s in signatures:
+                    for page in s.pages:
+                        resource_pool.insert_page(merger, page)
+
+                self.set_progress_stage("Saving output PDF...", ("write",))
+                output_paths.append(self.output_document_path)
+                with open(self.output_document_path, "bw") as fh:
+                    write_pdf(merger, fh, linearize=self.w_linearize.GetValue(), document_id=document_id)
+                    merger.close()
+        logging.info(
+            f"Wrote {sum(Path(path).stat().st_size for path in output_paths)} bytes to {len(output_paths)} files in "
+            f"{time.perf_counter() - write_start:.2f}s"
+        )
 
-        if self.w_double_up.GetValue():
-            logging.info("Doubling up pages")
-            doubled_up_sigs = []
-            self.w_progress_bar.SetValue(0)
-            self.w_progress_text.SetLabelText("Creating doubled-up pages...")
-            center_margin = None if self.w_double_up_centre_margin.GetValue() < 0 \
-                else self.w_double_up_centre_margin.GetValue()
-            for sig in signatures:
-                doubled_up_sigs.append(
-                    create_double_up(
-                        sig,
-                        target_height_mm=self.w_double_up_page_height.GetValue(),
-                        progress_bar=self.w_progress_bar,
-                        center_margin_mm=center_margin
-                    )
+        logging.info(f"Resource pool shared {resource_pool.shared} duplicate resources")
+
+        done_label = "Done!"
+        if self.w_subset_fonts.GetValue():
+            self.set_progress_stage("Subsetting fonts...")
+            with timer.stage("subset_fonts"):
+                size_before, size_after = subset_output_fonts(
+                    output_paths,
+                    linearize=self.w_linearize.GetValue(),
+                    document_id=document_id,
+                    progress_bar=self.w_progress_bar
                 )
-            signatures = doubled_up_sigs
+            done_label = f"Done! Subsetting fonts saved {(size_before - size_after) / 1e6:.1f}MB"
+        checkpoint.finish()
+
+        if self.w_export_proofs.GetValue():
+            self.set_progress_stage("Rendering proofs...")
+            with timer.stage("proofs"):
+                for path in output_paths:
+                    render_proofs(
+                        path,
+                        Path(path).with_name(Path(path).stem + "_proofs"),
+                        dpi=self.w_proof_dpi.GetValue(),
+                        contact_sheet=True,
+                        progress_bar=self.w_progress_bar
+                    )
 
-        self.w_progress_bar.SetValue(0)
-        self.w_progress_bar.SetRange(len(signatures))
-
-        if self.w_save_sigs_separately.GetValue():
-            self.w_progress_text.SetLabelText("Saving signatures...")
-            for i, s in enumerate(signatures):
-                file_name, ext = self.output_document_path.rsplit(".", 1)
-                with open(file_name + f"_{i}." + ext, "bw") as fh:
-                    writer = PdfWriter()
-                    for page in s.pages:
-                        writer.insert_page(page, writer.get_num_pages())
-                    writer.write(fh)
-                    writer.close()
-                    self.w_progress_bar.SetValue(self.w_progress_bar.GetValue() + 1)
-        else:
-            merger = PdfWriter()
-            self.w_progress_text.SetLabelText("Merging Signatures...")
-            for s in signatures:
-                for page in s.pages:
-                    merger.insert_page(page, merger.get_num_pages())
-                    self.w_progress_bar.SetValue(self.w_progress_bar.GetValue() + 1)
+        options = {key: value for key, value in job_settings.items() if key not in ('pages', 'signature_sizes')}
+        options.update({
+            'blank_pages': self.page_selection.count(None),
+            'save_signatures_separately': self.w_save_sigs_separately.GetValue(),
+            'split_volumes': self.w_split_volumes.GetValue(),
+            'linearize_output': self.w_linearize.GetValue(),
+            'deterministic_output': self.w_deterministic.GetValue(),
+            'subset_fonts': self.w_subset_fonts.GetValue(),
+            'export_proofs': self.w_export_proofs.GetValue(),
+            'speculative': imposed is not None or len(prepared) > 0
+        })
+        JobHistory().record(
+            input_hash=checkpoint.input_hash,
+            num_pages=self.get_num_pages(),
+            options=options,
+            signature_sizes=sig_sizes,
+            stage_seconds=timer.seconds,
+            total_seconds=time.perf_counter() - job_start,
+            output_bytes=sum(Path(path).stat().st_size for path in output_paths),
+            estimated_seconds=sum(self.job_estimate['stage_seconds'].values()) if self.job_estimate else None,
+            peak_memory_bytes=memory.stop()
+        )
+
+        self.w_progress_bar.Hide()
+        self.w_progress_text.SetLabelText(done_label)
+        self.s_main.Fit(self)
+
+    def reprint_sheets(self, _):
+        if self.pdf_reader is None:
+            raise ValueError("Should not have access reprint function without a pdfreader loaded.")
+
+        sig_sizes = [s.GetValue() for s in self.sig_spins]
+        with wx.TextEntryDialog(
+                self,
+                f"Signatures to reprint, with sheets as signature:sheets, e.g. '2, 5:1-2'.\n"
+                f"Signature sizes (sheets): {', '.join(str(s) for s in sig_sizes)}",
+                "Reprint"
+        ) as textDialog:
+            if textDialog.ShowModal() == wx.ID_CANCEL:
+                return
+            selection_str = textDialog.GetValue()
+        try:
+            selection = parse_reprint_selection(selection_str, sig_sizes)
+        except ValueError as e:
+            dlg = wx.MessageDialog(self, str(e), "Bad Reprint Selection", wx.OK | wx.ICON_WARNING | wx.CENTER)
+            dlg.ShowModal()
+            return
+
+        reprint_start = time.perf_counter()
+        writer = create_reprint(
+            self.pdf_reader.subset(self.page_selection),
+            sig_sizes,
+            selection,
+            add_side_lines=self.w_add_lines.GetValue(),
+            double_up_height_mm=self.w_double_up_page_height.GetValue() if self.w_double_up.GetValue() else None,
+            center_margin_mm=None if self.w_double_up_centre_margin.GetValue() < 0
+            else self.w_double_up_centre_margin.GetValue(),
+            cut_and_stack=self.w_cut_and_stack.GetValue(),
+            layout=self.plan_layout() if self.w_optimise_sheet.GetValue() else None,
+            marks=SheetMarks(**{mark: checkbox.GetValue() for mark, checkbox in self.w_marks.items()})
+        )
+        file_name, ext = self.output_document_path.rsplit(".", 1)
+        output_path = f"{file_name}_reprint.{ext}"
+        with open(output_path, "bw") as fh:
+            write_pdf(writer, fh, linearize=self.w_linearize.GetValue())
+            writer.close()
+        logging.info(f"Reprinted {len(writer.pages)} sides in {time.perf_counter() - reprint_start:.3f}s")
+
+        self.w_progress_text.Show()
+        self.w_progress_text.SetLabelText(f"Reprint saved to {output_path}")
+        self.s_main.Fit(self)
+
+    def gang_booklets(self, _):
+        with wx.FileDialog(
+                self,
+                message="Open booklets to gang",
+                wildcard="PDF files (*.pdf)|*.pdf",
+                style=wx.FD_OPEN | wx.FD_FILE_MUST_EXIST | wx.FD_MULTIPLE
+        ) as fileDialog:
+            if fileDialog.ShowModal() == wx.ID_CANCEL:
+                return
+            input_paths = fileDialog.GetPaths()
+
+        with wx.SingleChoiceDialog(self, "Press sheet size:", "Gang Booklets", list(GANG_SHEET_SIZES)) as choiceDialog:
+            if choiceDialog.ShowModal() == wx.ID_CANCEL:
+                return
+            sheet_size = GANG_SHEET_SIZES[choiceDialog.GetStringSelection()]
+
+        with wx.FileDialog(
+                self,
+                message="Save PDF file",
+                defaultFile="ganged.pdf",
+                wildcard="PDF files (*.pdf)|*.pdf",
+                style=wx.FD_SAVE
+        ) as fileDialog:
+            if fileDialog.ShowModal() == wx.ID_CANCEL:
+                return
+            output_path = fileDialog.GetPath()
+
+        self.w_progress_bar.Show()
+        self.w_progress_text.Show()
+        self.w_progress_text.SetLabelText("Creating signatures...")
+        self.s_main.Fit(self)
+
+        marks = SheetMarks(**{mark: checkbox.GetValue() for mark, checkbox in self.w_marks.items()})
+        booklets: list[PdfWriter] = []
+        # Kept open until the output is written, then closed so the booklets aren't left locked
+        readers: list[SubsetReader] = []
+        try:
+            for path in input_paths:
+                reader = SubsetReader(path)
+                readers.append(reader)
+                num_pages = reader.get_num_pages()
+                if num_pages % 4 != 0:
+                    dlg = wx.MessageDialog(
+                        self,
+                        f"{Path(path).name} must have a number of pages divisible by 4, has {num_pages}.",
+                        "Bad File",
+                        wx.OK | wx.ICON_WARNING | wx.CENTER
+                    )
+                    dlg.ShowModal()
+                    self.w_progress_bar.Hide()
+                    self.w_progress_text.Hide()
+                    return
+                sig_sizes = calc_signature_sizes(num_pages, get_ideal_num_sigs(num_pages))
+                for i, page_range in enumerate(get_signature_page_indexes(sig_sizes)):
+                    booklets.append(create_signature(reader, page_range, marks=marks, signature_index=i))
+
+            self.w_progress_text.SetLabelText("Ganging sheets...")
+            writer, sheets_saved = create_gang(booklets, sheet_size, progress_bar=self.w_progress_bar, marks=marks)
 
             self.w_progress_text.SetLabelText("Saving output PDF...")
-            with open(self.output_document_path, "bw") as fh:
-                merger.write(fh)
-                merger.close()
+            with open(output_path, "bw") as fh:
+                write_pdf(writer, fh, linearize=self.w_linearize.GetValue())
+                writer.close()
+        finally:
+            for reader in readers:
+                reader.close()
 
         self.w_progress_bar.Hide()
-        self.w_progress_text.SetLabelText("Done!")
+        self.w_progress_text.SetLabelText(f"Done! Saved {sheets_saved} press sheets.")
         self.s_main.Fit(self)
 
 
-def add_lines(reader: PdfReader, line_page_index: int) -> PdfReader:
-    logging.debug("Adding lines")
+class SubsetReader:
+    """
+    Read only view of selected pages of a PDF.
 
-    tmp_writer = PdfWriter(reader)
-    pdf_stream = io.BytesIO()
-    tmp_writer.write(stream=pdf_stream)
-    pdf_stream.seek(0)
-    mu_pdf = pymupdf.Document(stream=pdf_stream)
-    last_page = mu_pdf.load_page(line_page_index)
-    width = last_page.mediabox.width
-    height = last_page.mediabox.height
-    # pymupdf uses top left as origin
-    top_p1 = (0, 0)
-    top_p2 = (width, 0)
-    side_p1 = top_p2
-    side_p2 = (width, height)
-    last_page.draw_line(
-        p1=top_p1,
-        p2=top_p2
-    )
-    last_page.draw_line(
-        p1=side_p1,
-        p2=side_p2
+    The file is read through an open handle rather than loaded into memory, and pages are found by walking the page
+    tree using each node's /Count, so only the selected pages and the objects they use are ever parsed.
+
+    A page index of None is a blank page the size of the first selected page, as added by pad_page_selection. Every
+    blank is the same page object, with no content, so padding adds nothing to the output.
+    """
+
+    def __init__(
+            self,
+            path: Union[str, Path, BinaryIO],
+            page_indexes: Optional[list[Optional[int]]] = None,
+            _reader=None
+    ):
+        if _reader is None:
+            self._fh = path if hasattr(path, "read") else open(path, "rb")
+            self.reader = PdfReader(self._fh)
+        else:
+            self._fh = None
+            self.reader = _reader
+        self.path = path
+        # Not reader.get_num_pages(), which parses every page of the document to count them
+        self.num_source_pages = int(self.reader.trailer["/Root"]["/Pages"]["/Count"])
+        self.page_indexes = list(range(self.num_source_pages)) if page_indexes is None else page_indexes
+        self._resolved: dict[Optional[int], PageObject] = {}
+        self._replaced: dict[int, PageObject] = {}
+
+    def subset(self, page_indexes: list[Optional[int]]) -> "SubsetReader":
+        """Returns a view of some pages of this reader's source document, sharing the open file."""
+        view = type(self)(self.path, page_indexes, _reader=self.reader)
+        view._resolved = self._resolved
+        return view
+
+    @property
+    def pages(self) -> "_SubsetPages":
+        return _SubsetPages(self)
+
+    def get_num_pages(self) -> int:
+        return len(self.page_indexes)
+
+    def get_source_page(self, index: Optional[int]) -> PageObject:
+        if index not in self._resolved:
+            self._resolved[index] = self._find_page(index) if index is not None else self._blank_page()
+        return self._resolved[index]
+
+    def _blank_page(self) -> PageObject:
+        first_index = next((i for i in self.page_indexes if i is not None), 0)
+        mediabox = self.get_source_page(first_index).mediabox
+        return PageObject.create_blank_page(None, mediabox.width, mediabox.height)
+
+    def _find_page(self, index: int) -> PageObject:
+        if not 0 <= index < self.num_source_pages:
+            raise IndexError(f"Page index {index} out of range")
+        node_ref = self.reader.trailer["/Root"].raw_get("/Pages")
+        node = node_ref.get_object()
+        inherited = {}
+        while node.get("/Type") != "/Page" and "/Kids" in node:
+            for attr in INHERITABLE_PAGE_ATTRIBUTES:
+                if attr in node:
+                    inherited[attr] = node.raw_get(attr)
+            kids = node["/Kids"]
+            if node.get("/Count") == len(kids) and index < len(kids):
+                # As many pages as kids means every kid is a page, as in a flat tree, so go straight to it
+                kid_ref = kids[index]
+                kid = kid_ref.get_object()
+                if "/Kids" not in kid:
+                    node_ref, node = kid_ref, kid
+                    break
+            for kid_ref in kids:
+                kid = kid_ref.get_object()
+                kid_count = kid.get("/Count", 1) if "/Kids" in kid else 1
+                if index < kid_count:
+                    node_ref, node = kid_ref, kid
+                    break
+                index -= kid_count
+            else:
+                raise IndexError("Page tree is shorter than its /Count")
+
+        page = PageObject(self.reader, node_ref)
+        page.update(node)
+        for attr, value in inherited.items():
+            if attr not in page:
+                page[NameObject(attr)] = value
+        return page
+
+    def replace_page(self, index: int, page: PageObject) -> "SubsetReader":
+        """Returns a view of the same pages, but with the page at index replaced. Further subsets don't keep it."""
+        view = self.subset(self.page_indexes)
+        view._replaced = {**self._replaced, index % self.get_num_pages(): page}
+        return view
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+
+
+class _SubsetPages:
+    def __init__(self, subset: SubsetReader):
+        self.subset = subset
+
+    def __len__(self) -> int:
+        return len(self.subset.page_indexes)
+
+    def __getitem__(self, index: int) -> PageObject:
+        index %= len(self)
+        if index in self.subset._replaced:
+            return self.subset._replaced[index]
+        return self.subset.get_source_page(self.subset.page_indexes[index])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class ImageDirectoryReader(SubsetReader):
+    """
+    Read only view of a directory of JPEG and JPEG 2000 page scans, in natural order, as if it were a PDF.
+
+    Each image becomes a page of its own size at its recorded resolution which draws the file's compressed data
+    as an image XObject, so nothing is decoded or recompressed on the way to the output.
+    """
+
+    def __init__(self, path: Union[str, Path], page_indexes: Optional[list[Optional[int]]] = None, _reader=None):
+        self._fh = None
+        # Holds the image and page objects so they can be cloned into output documents like any other source
+        self.reader = PdfWriter() if _reader is None else _reader
+        self.path = path
+        self.image_paths = list_page_images(path)
+        self.num_source_pages = len(self.image_paths)
+        self.page_indexes = list(range(self.num_source_pages)) if page_indexes is None else page_indexes
+        self._resolved: dict[Optional[int], PageObject] = {}
+        self._replaced: dict[int, PageObject] = {}
+
+    def _find_page(self, index: int) -> PageObject:
+        if not 0 <= index < self.num_source_pages:
+            raise IndexError(f"Page index {index} out of range")
+        with open(self.image_paths[index], "rb") as fh:
+            data = fh.read()
+        info = read_image_info(io.BytesIO(data))
+
+        image = StreamObject()
+        image.update({
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Image"),
+            NameObject("/Width"): NumberObject(info['width']),
+            NameObject("/Height"): NumberObject(info['height']),
+            NameObject("/Filter"): NameObject(info['filter']),
+        })
+        if info['filter'] == "/DCTDecode":
+            image[NameObject("/BitsPerComponent")] = NumberObject(info['bits'])
+            image[NameObject("/ColorSpace")] = NameObject(
+                {1: "/DeviceGray", 3: "/DeviceRGB", 4: "/DeviceCMYK"}[info['components']]
+            )
+            if info['components'] == 4 and info['adobe']:
+                # Adobe writes CMYK JPEGs inverted
+                image[NameObject("/Decode")] = ArrayObject([NumberObject(v) for v in (1, 0) * 4])
+        image.set_data(data)
+
+        width = info['width'] * 72 / info['dpi'][0]
+        height = info['height'] * 72 / info['dpi'][1]
+        content = StreamObject()
+        content.set_data(f"q {width:.4f} 0 0 {height:.4f} 0 0 cm /Im0 Do Q".encode())
+        page = self.reader.add_blank_page(width, height)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/XObject"): DictionaryObject({NameObject("/Im0"): self.reader._add_object(image)})
+        })
+        page[NameObject("/Contents")] = self.reader._add_object(content)
+        return page
+
+
+def open_input(path: Union[str, Path]) -> SubsetReader:
+    """Open a PDF, or a directory of page images, for imposition."""
+    return ImageDirectoryReader(path) if Path(path).is_dir() else SubsetReader(path)
+
+
+def open_stream(stream: BinaryIO) -> SubsetReader:
+    """
+    Open a PDF read from a stream, such as stdin, for imposition.
+
+    pypdf needs to seek, so a stream that can't, like a pipe, is first spooled to memory, or to an anonymous temporary
+    file once it passes STREAM_SPOOL_MAX_BYTES. Nothing is left on disk once the reader is closed.
+    """
+    if not stream.seekable():
+        spool = tempfile.SpooledTemporaryFile(max_size=STREAM_SPOOL_MAX_BYTES)
+        shutil.copyfileobj(stream, spool)
+        spool.seek(0)
+        stream = spool
+    return SubsetReader(stream)
+
+
+def list_page_images(directory: Union[str, Path]) -> list[Path]:
+    """The JPEG and JPEG 2000 images in directory, in natural order so page10 follows page9."""
+    return sorted(
+        (p for p in Path(directory).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES),
+        key=lambda p: [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", p.name)]
     )
-    mu_stream = io.BytesIO(mu_pdf.tobytes())
-    mu_stream.seek(0)
-    return PdfReader(mu_stream)
 
 
-def get_page_range_numbers(range_str: str, max_page: int) -> tuple[int, int]:
-    p1, p2 = range_str.split("-")
+def read_image_info(fh: BinaryIO) -> dict[str, Any]:
+    """
+    Read the size, resolution and colour layout of a JPEG or JP2 image from its headers, without decoding it.
+
+    Segments and boxes that aren't needed are seeked past rather than read, so only the headers are read however
+    much metadata comes before them.
+
+    Returns
+    -------
+    dict[str, Any]
+        'filter', 'width', 'height', 'components', 'bits', 'dpi' as (x, y) and, for JPEGs, whether it has an
+        'adobe' marker.
+    """
+    try:
+        return _read_image_headers(fh)
+    except struct.error as e:
+        # A header cut short, as in a truncated file, comes up short of the bytes a field is unpacked from
+        raise ValueError(f"Truncated image header: {e}") from e
+
+
+def _read_image_headers(fh: BinaryIO) -> dict[str, Any]:
+    info = {'components': None, 'bits': None, 'dpi': (IMAGE_DEFAULT_DPI, IMAGE_DEFAULT_DPI), 'adobe': False}
+    start = fh.tell()
+    signature = fh.read(12)
+
+    if signature[:2] == b"\xff\xd8":
+        info['filter'] = "/DCTDecode"
+        fh.seek(start + 2)
+        while len(header := fh.read(4)) == 4:
+            if header[0] != 0xFF:
+                raise ValueError("Corrupt JPEG marker")
+            marker = header[1]
+            if marker == 0xFF:
+                fh.seek(-3, io.SEEK_CUR)
+                continue
+            length = struct.unpack(">H", header[2:4])[0]
+            if marker == 0xE0 or marker == 0xEE or (0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC)):
+                segment = fh.read(length - 2)
+            else:
+                fh.seek(length - 2, io.SEEK_CUR)
+                continue
+            if marker == 0xE0 and segment[:5] == b"JFIF\x00":
+                units, x_density, y_density = struct.unpack(">BHH", segment[7:12])
+                if units in (1, 2) and x_density and y_density:
+                    scale = 1 if units == 1 else 2.54
+                    info['dpi'] = (x_density * scale, y_density * scale)
+            elif marker == 0xEE and segment[:5] == b"Adobe":
+                info['adobe'] = True
+            elif 0xC0 <= marker <= 0xCF:
+                info['bits'], info['height'], info['width'], info['components'] = struct.unpack(">BHHB", segment[:6])
+                return info
+        raise ValueError("JPEG has no frame header")
+
+    if signature[4:8] == b"jP  ":
+        info['filter'] = "/JPXDecode"
+        file_end = fh.seek(0, io.SEEK_END)
+        boxes = [(start, file_end)]
+        while boxes:
+            pos, end = boxes.pop()
+            while pos + 8 <= end:
+                fh.seek(pos)
+                length, box_type = struct.unpack(">I4s", fh.read(8))
+                header = 8
+                if length == 1:
+                    length = struct.unpack(">Q", fh.read(8))[0]
+                    header = 16
+                elif length == 0:
+                    length = end - pos
+                if box_type in (b"jp2h", b"res "):
+                    boxes.append((pos + header, pos + length))
+                elif box_type == b"ihdr":
+                    info['height'], info['width'], info['components'], bits = struct.unpack(">IIHB", fh.read(11))
+                    info['bits'] = (bits & 0x7F) + 1
+                elif box_type == b"resc":
+                    v_num, v_den, h_num, h_den, v_exp, h_exp = struct.unpack(">HHHHbb", fh.read(10))
+                    # Grid points per metre
+                    info['dpi'] = (h_num / h_den * 10 ** h_exp * 0.0254, v_num / v_den * 10 ** v_exp * 0.0254)
+                elif box_type == b"jp2c":
+                    # The codestream follows the headers, and is most of the file
+                    break
+                pos += length
+        if 'width' not in info:
+            raise ValueError("JP2 has no image header")
+        return info
+
+    raise ValueError("Not a JPEG or JP2 image")
+
+
+class JobCheckpoint:
+    """
+    Saves each finished signature to a job directory so an interrupted run can resume where it stopped.
+
+    The directory is named from a fingerprint of the input and the job settings, and holds one PDF per finished
+    stage of each signature along with a manifest listing them. It is removed once the output has been written.
+    """
+
+    def __init__(self, job_dir: Path, job_settings: dict[str, Any], input_hash: Optional[str] = None):
+        self.job_dir = job_dir
+        self.input_hash = input_hash
+        self.manifest_path = job_dir / "manifest.json"
+        self.manifest: dict[str, Any] = {'settings': job_settings, 'completed': {}}
+        try:
+            with self.manifest_path.open("r") as fh:
+                manifest = json.load(fh)
+            if manifest['settings'] == job_settings:
+                self.manifest = manifest
+                logging.info(f"Resuming job from {job_dir}, {len(manifest['completed'])} stages already done")
+        except FileNotFoundError:
+            pass
+        except (JSONDecodeError, KeyError) as e:
+            logging.exception(e)
+
+    @classmethod
+    def for_input(cls, reader: SubsetReader, job_settings: dict[str, Any]) -> "JobCheckpoint":
+        digest = fingerprint_input(reader)
+        input_hash = digest.hexdigest()
+        digest.update(json.dumps(job_settings, sort_keys=True).encode())
+        return cls(JOBS_PATH / digest.hexdigest(), job_settings, input_hash)
+
+    def load(self, stage: str, index: int) -> Optional[PdfReader]:
+        file_name = self.manifest['completed'].get(f"{stage}_{index}")
+        if file_name is None or not (self.job_dir / file_name).exists():
+            return None
+        logging.debug(f"Loading {stage} {index} from checkpoint")
+        return PdfReader(self.job_dir / file_name)
+
+    def save(self, stage: str, index: int, document: PdfWriter):
+        self.job_dir.mkdir(parents=True, exist_ok=True)
+        file_name = f"{stage}_{index}.pdf"
+        tmp_path = self.job_dir / (file_name + ".tmp")
+        with tmp_path.open("bw") as fh:
+            write_pdf(document, fh)
+        os.replace(tmp_path, self.job_dir / file_name)
+
+        self.manifest['completed'][f"{stage}_{index}"] = file_name
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        with tmp_path.open("w") as fh:
+            # noinspection PyTypeChecker
+            json.dump(self.manifest, fh)
+        os.replace(tmp_path, self.manifest_path)
+
+    def is_complete(self, stage: str, count: int) -> bool:
+        return all(f"{stage}_{i}" in self.manifest['completed'] for i in range(count))
+
+    def finish(self):
+        shutil.rmtree(self.job_dir, ignore_errors=True)
+
+
+def fingerprint_input(reader: SubsetReader) -> "hashlib._Hash":
+    """
+    SHA-1 identifying an input without reading it through, so it costs the same whatever the size of the source.
+
+    A directory of images is identified by the name, size and modification time of each image, and a PDF file by
+    its size, modification time and trailer /ID. A PDF read from a stream has no modification time, so it is
+    identified by its size and /ID, or hashed whole if it has no /ID.
+    """
+    digest = hashlib.sha1()
+    if isinstance(reader, ImageDirectoryReader):
+        for path in reader.image_paths:
+            stat = path.stat()
+            digest.update(f"{path.name} {stat.st_size} {stat.st_mtime_ns}\n".encode())
+        return digest
+
+    document_id = reader.reader.trailer.get("/ID")
+    if document_id is not None:
+        for part in document_id.get_object():
+            digest.update(part.get_object().original_bytes)
+    if not hasattr(reader.path, "read"):
+        stat = Path(reader.path).stat()
+        digest.update(f"{stat.st_size} {stat.st_mtime_ns}".encode())
+        return digest
+
+    stream = reader.path
+    position = stream.tell()
+    digest.update(str(stream.seek(0, io.SEEK_END)).encode())
+    if document_id is None:
+        stream.seek(0)
+        for chunk in iter(lambda: stream.read(1 << 20), b""):
+            digest.update(chunk)
+    stream.seek(position)
+    return digest
+
+
+def content_document_id(reader: SubsetReader, job_settings: dict[str, Any]) -> bytes:
+    """
+    The /ID for deterministic output: a hash of the selected pages, everything they use, and the job settings.
+
+    Unlike fingerprint_input it doesn't depend on where the input is or when it was written, so a copy of an input
+    imposes to the same bytes. Only the selected pages are read, which are read to be imposed anyway.
+    """
+    digest = hashlib.sha1()
+    hashes: dict[tuple[int, int], bytes] = {}
+
+    def object_hash(obj: PdfObject) -> bytes:
+        if isinstance(obj, IndirectObject):
+            key = (id(obj.pdf), obj.idnum)
+            if key not in hashes:
+                # Placeholder breaks reference cycles, such as an annotation's /P back to its page
+                hashes[key] = f"cycle {obj.idnum}".encode()
+                hashes[key] = object_hash(obj.get_object())
+            return hashes[key]
+
+        object_digest = hashlib.sha1(type(obj).__name__.encode())
+        if isinstance(obj, DictionaryObject):
+            # A page's /Parent leads to the whole page tree, and every page already has what it inherits
+            for k in sorted(k for k in obj.keys() if k != "/Parent"):
+                object_digest.update(k.encode())
+                object_digest.update(object_hash(obj.raw_get(k)))
+            if isinstance(obj, StreamObject):
+                object_digest.update(obj._data)
+        elif isinstance(obj, ArrayObject):
+            for item in obj:
+                object_digest.update(object_hash(item))
+        else:
+            object_digest.update(repr(obj).encode())
+        return object_digest.digest()
+
+    for page in reader.pages:
+        digest.update(object_hash(page))
+    digest.update(json.dumps(job_settings, sort_keys=True).encode())
+    return digest.hexdigest()[:32].encode()
+
+
+class StageTimer:
+    """
+    Adds up the wall time spent in each stage of a job.
+
+    Stages nest, and time spent in an inner stage is counted only there, so signatures imposed lazily while the
+    output is written don't count as writing too.
+    """
+
+    def __init__(self):
+        self.seconds: dict[str, float] = {}
+        self._inner: list[float] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        self._inner.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            inner = self._inner.pop()
+            self.seconds[name] = self.seconds.get(name, 0.0) + elapsed - inner
+            if self._inner:
+                self._inner[-1] += elapsed
+
+
+def resident_memory_bytes() -> Optional[int]:
+    """The memory this process has resident now, or None if it can't be read."""
     try:
-        start = int(p1)
-    except ValueError:
-        start = 1
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
     try:
-        end = int(p2)
-    except ValueError:
-        end = max_page
+        import ctypes
+
+        class MemoryCounters(ctypes.Structure):
+            # PROCESS_MEMORY_COUNTERS, the second of its sizes is WorkingSetSize
+            _fields_ = [("cb", ctypes.c_ulong), ("page_fault_count", ctypes.c_ulong)] + [
+                (f"size_{i}", ctypes.c_size_t) for i in range(8)
+            ]
+
+        counters = MemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.size_1
+    except (AttributeError, OSError) as e:
+        logging.debug(f"Could not read resident memory: {e}")
+    return None
+
+
+class PeakMemoryMonitor:
+    """
+    Measures the most memory the process has resident between start and stop, such as over one job.
+
+    On Linux the kernel's high-water mark is reset through /proc/self/clear_refs at start and read at stop. Elsewhere
+    the resident size is sampled every MEMORY_SAMPLE_SECONDS on a background thread. Where neither can be read the
+    peak is None, rather than the peak of the whole process, which would repeat the largest job run so far.
+    """
+
+    def __init__(self):
+        self.peak_bytes: Optional[int] = None
+        self._high_water_mark = False
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        try:
+            with open("/proc/self/clear_refs", "w") as fh:
+                fh.write("5")
+            self._high_water_mark = True
+            return
+        except OSError:
+            pass
+        self.peak_bytes = resident_memory_bytes()
+        if self.peak_bytes is not None:
+            # The thread only holds the monitor weakly, so it ends with a job that fails before stopping it
+            self._thread = threading.Thread(target=self._sample, args=(weakref.ref(self), self._stopped), daemon=True)
+            self._thread.start()
+
+    def stop(self) -> Optional[int]:
+        if self._high_water_mark:
+            with open("/proc/self/status") as fh:
+                for line in fh:
+                    if line.startswith("VmHWM:"):
+                        self.peak_bytes = int(line.split()[1]) * 1024
+        elif self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+        return self.peak_bytes
+
+    @staticmethod
+    def _sample(monitor_ref: "weakref.ref[PeakMemoryMonitor]", stopped: threading.Event):
+        while not stopped.wait(MEMORY_SAMPLE_SECONDS):
+            monitor = monitor_ref()
+            if monitor is None:
+                return
+            monitor.peak_bytes = max(monitor.peak_bytes, resident_memory_bytes() or 0)
+            del monitor
+
+
+class JobHistory:
+    """
+    Keeps a record of every job run in an SQLite database, to follow throughput across runs.
+
+    Each job is stored with its input fingerprint, page count, options, signature plan, wall time per stage, peak
+    memory over the job and the output size, along with the pypdf and pymupdf versions and the machine it ran on, so a
+    slowdown after an upgrade or on a particular machine shows up in report.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            finished_at TEXT NOT NULL,
+            input_hash TEXT,
+            num_pages INTEGER NOT NULL,
+            options TEXT NOT NULL,
+            signature_sizes TEXT NOT NULL,
+            total_seconds REAL NOT NULL,
+            estimated_seconds REAL,
+            peak_memory_bytes INTEGER,
+            output_bytes INTEGER,
+            versions TEXT NOT NULL,
+            machine TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS job_stages (
+            job_id INTEGER NOT NULL REFERENCES jobs (id),
+            stage TEXT NOT NULL,
+            seconds REAL NOT NULL,
+            PRIMARY KEY (job_id, stage)
+        );
+    """
+
+    def __init__(self, path: Union[str, Path] = HISTORY_PATH):
+        self.path = path
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path)
+        connection.executescript(self.SCHEMA)
+        return connection
+
+    def record(
+            self,
+            input_hash: Optional[str],
+            num_pages: int,
+            options: dict[str, Any],
+            signature_sizes: list[int],
+            stage_seconds: dict[str, float],
+            total_seconds: float,
+            output_bytes: Optional[int],
+            estimated_seconds: Optional[float] = None,
+            peak_memory_bytes: Optional[int] = None
+    ) -> Optional[int]:
+        """Store a finished job, returning its id. A history that can't be written is logged rather than raised."""
+        try:
+            connection = self._connect()
+            try:
+                with connection:
+                    cursor = connection.execute(
+                        "INSERT INTO jobs (finished_at, input_hash, num_pages, options, signature_sizes, "
+                        "total_seconds, estimated_seconds, peak_memory_bytes, output_bytes, versions, machine) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            datetime.now().isoformat(timespec="seconds"),
+                            input_hash,
+                            num_pages,
+                            json.dumps(options, sort_keys=True),
+                            json.dumps(signature_sizes),
+                            total_seconds,
+                            estimated_seconds,
+                            peak_memory_bytes,
+                            output_bytes,
+                            f"pypdf {PYPDF_VERSION}, pymupdf {pymupdf.VersionBind}",
+                            f"{platform.node()} ({os.cpu_count()} CPUs)"
+                        )
+                    )
+                    connection.executemany(
+                        "INSERT INTO job_stages (job_id, stage, seconds) VALUES (?, ?, ?)",
+                        [(cursor.lastrowid, stage, seconds) for stage, seconds in stage_seconds.items()]
+                    )
+            finally:
+                connection.close()
+        except sqlite3.Error as e:
+            logging.exception(e)
+            return None
+        logging.info(f"Recorded job {cursor.lastrowid} in {self.path}")
+        return cursor.lastrowid
+
+    def report(self, limit: int = 20) -> str:
+        """The last limit jobs with their throughput, then throughput of each stage by library versions and machine."""
+        if not Path(self.path).exists():
+            return f"No jobs recorded in {self.path}"
+        connection = self._connect()
+        try:
+            jobs = connection.execute(
+                "SELECT finished_at, num_pages, total_seconds, estimated_seconds, peak_memory_bytes, output_bytes, "
+                "versions FROM jobs ORDER BY id DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+            stages = connection.execute(
+                "SELECT j.versions, j.machine, s.stage, COUNT(*), SUM(j.num_pages), SUM(s.seconds) "
+                "FROM job_stages s JOIN jobs j ON j.id = s.job_id "
+                "GROUP BY j.versions, j.machine, s.stage ORDER BY MIN(j.id), MIN(s.rowid)"
+            ).fetchall()
+        finally:
+            connection.close()
+        if not jobs:
+            return f"No jobs recorded in {self.path}"
+
+        lines = [
+            f"{'Finished':<20} {'Pages':>6} {'Seconds':>8} {'Pages/s':>8} {'Estimate':>8} {'Peak MB':>8} "
+            f"{'Output MB':>9}  Versions"
+        ]
+        for finished_at, num_pages, seconds, estimate, peak, output, versions in reversed(jobs):
+            lines.append(
+                f"{finished_at:<20} {num_pages:>6} {seconds:>8.1f} {num_pages / max(seconds, 1e-6):>8.1f} "
+                f"{'' if estimate is None else f'{estimate:.1f}':>8} {'' if peak is None else f'{peak / 1e6:.0f}':>8} "
+                f"{'' if output is None else f'{output / 1e6:.1f}':>9}  {versions}"
+            )
+
+        groups: dict[tuple[str, str], list[str]] = {}
+        for versions, machine, stage, runs, num_pages, seconds in stages:
+            groups.setdefault((versions, machine), []).append(
+                f"{stage} {num_pages / seconds:.0f} pages/s ({runs} runs)" if seconds else f"{stage} ({runs} runs)"
+            )
+        lines.append("")
+        lines.append("Stage throughput:")
+        for (versions, machine), stage_lines in groups.items():
+            lines.append(f"{versions} on {machine}: " + ", ".join(stage_lines))
+        return "\n".join(lines)
+
+
+class SpeculativeImposer:
+    """
+    Imposes a job on a background thread while the operator is still setting it up.
+
+    Each call to start cancels the work for the plan before, keeping every signature it finished that the new plan
+    still uses, and imposes the new plan. Signatures are kept by the pages and marks they were made from, so
+    changing only how they are placed on sheets reuses them all. Work is cancelled between signatures.
+
+    The thread reads the input through its own reader, so it shares no pypdf objects with the window.
+    """
+
+    def __init__(self, input_path: Union[str, Path]):
+        self.input_path = input_path
+        self.plan: Optional[dict[str, Any]] = None
+        self.signatures: dict[tuple, PdfReader | PdfWriter] = {}
+        self.imposed: Optional[tuple[dict[str, Any], list[PdfReader | PdfWriter]]] = None
+        self._thread: Optional[threading.Thread] = None
+        self._cancelled = threading.Event()
+
+    @staticmethod
+    def signature_keys(plan: dict[str, Any]) -> list[tuple]:
+        """
+        Identify each signature of a plan by everything that goes into making it, including the size of the first
+        selected page, as every sheet is sized from it whichever pages the signature holds.
+        """
+        marks = tuple(sorted(plan['marks'].items()))
+        keys = []
+        for i, (first, last) in enumerate(get_signature_page_indexes(plan['signature_sizes'])):
+            pages = tuple(plan['pages'][first:last + 1])
+            lined = plan['add_side_lines'] and last == len(plan['pages']) - 1
+            keys.append((pages, lined, marks, plan['page_size'], i))
+        return keys
+
+    def start(self, plan: dict[str, Any]):
+        if plan == self.plan:
+            return
+        self._cancelled.set()
+        self.plan = plan
+        keys = set(self.signature_keys(plan))
+        # The cancelled thread may still be adding a signature, so copy the items before filtering them
+        self.signatures = {key: signature for key, signature in list(self.signatures.items()) if key in keys}
+        self.imposed = None
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(plan, self._cancelled), daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self._cancelled.set()
+        self.plan = None
+
+    def take(
+            self,
+            plan: dict[str, Any]
+    ) -> tuple[Optional[list[PdfReader | PdfWriter]], dict[int, PdfReader | PdfWriter]]:
+        """
+        Collect the speculative work for the plan about to be run.
+
+        If the background thread is imposing this plan it is left to finish, otherwise it is cancelled. Everything
+        imposed is handed over and let go of, so none of it is held once the job has been written.
+
+        Returns
+        -------
+        tuple[Optional[list[PdfReader | PdfWriter]], dict[int, PdfReader | PdfWriter]]
+            The finished output of impose_signatures if the plan was fully imposed, else None, and the signatures
+            already made for it by index.
+        """
+        if plan != self.plan:
+            self.cancel()
+        while self._thread is not None and self._thread.is_alive():
+            self._thread.join(0.05)
+            wx.Yield()
+        if self.imposed is not None and self.imposed[0] == plan:
+            imposed, prepared = self.imposed[1], {}
+        else:
+            imposed, prepared = None, {
+                i: self.signatures[key] for i, key in enumerate(self.signature_keys(plan)) if key in self.signatures
+            }
+        self.plan = None
+        self.signatures = {}
+        self.imposed = None
+        return imposed, prepared
+
+    def _run(self, plan: dict[str, Any], cancelled: threading.Event):
+        start = time.perf_counter()
+        source = None
+        try:
+            source = open_input(self.input_path)
+            reader = source.subset(plan['pages'])
+            if plan['add_side_lines']:
+                reader = add_lines_to_last_page(reader)
+            marks = SheetMarks(**plan['marks'])
+            page_ranges = get_signature_page_indexes(plan['signature_sizes'])
+            for i, key in enumerate(self.signature_keys(plan)):
+                if cancelled.is_set():
+                    return
+                if key not in self.signatures:
+                    self.signatures[key] = create_signature(
+                        reader, page_ranges[i], None, marks=marks, signature_index=i
+                    )
+
+            imposed: list[PdfReader | PdfWriter] = []
+            for document in impose_signatures(
+                    reader,
+                    plan['signature_sizes'],
+                    double_up_height_mm=plan['double_up_height_mm'],
+                    center_margin_mm=plan['center_margin_mm'],
+                    cut_and_stack=plan['cut_and_stack'],
+                    layout=plan['layout'],
+                    marks=marks,
+                    prepared={i: self.signatures[key] for i, key in enumerate(self.signature_keys(plan))}
+            ):
+                if cancelled.is_set():
+                    return
+                imposed.append(document)
+            self.imposed = (plan, imposed)
+            logging.info(f"Speculatively imposed {len(imposed)} documents in {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            logging.exception(e)
+        finally:
+            if source is not None:
+                source.close()
+
+
+class ResourcePool:
+    """
+    Shares fonts, images and graphics states between the pages inserted into a writer.
+
+    Every signature is built in its own PdfWriter, each holding its own copy of the source resources, so a font
+    used throughout a book would otherwise be written once per signature. Resources are matched by a hash of their
+    content (memoised on the identity of the source object) and each distinct one is only cloned into a writer once.
+
+    Given sheet_object_block, each inserted page's new objects are numbered from the next multiple of the block, so
+    that identical inputs number identically and a change to one sheet leaves the others' object numbers alone.
+    """
+
+    def __init__(self, sheet_object_block: Optional[int] = None):
+        self.sheet_object_block = sheet_object_block
+        # Keyed on id() of source documents and writers, entries are dropped when the document is collected so
+        # signatures and volumes can be freed as soon as they are written without their ids being mistaken later.
+        self._hashes: dict[int, dict[int, bytes]] = {}
+        self._pooled: dict[int, dict[bytes, int]] = {}
+        self._sheet_counts: dict[int, dict[str, int]] = {}
+        self.shared = 0
+
+    def _document_table(self, table: dict[int, dict], document: Any) -> dict:
+        if id(document) not in table:
+            table[id(document)] = {}
+            weakref.finalize(document, table.pop, id(document), None)
+        return table[id(document)]
+
+    def insert_page(self, writer: PdfWriter, page: PageObject) -> PageObject:
+        """Append page to writer, pointing its resources at any identical resources the writer already holds."""
+        refs = [(ref, self.content_hash(ref)) for ref in page_resource_refs(page)]
+        pooled = self._document_table(self._pooled, writer)
+
+        for ref, content_hash in refs:
+            pooled_idnum = pooled.get(content_hash)
+            if pooled_idnum is None:
+                continue
+            translated = writer._id_translated.setdefault(id(ref.pdf), {"PreventGC": ref.pdf})
+            if translated.get(ref.idnum) != pooled_idnum:
+                translated[ref.idnum] = pooled_idnum
+                self.shared += 1
+
+        if self.sheet_object_block is not None:
+            sheet_counts = self._document_table(self._sheet_counts, writer)
+            sheet_index = sheet_counts.get('sheets', 0)
+            sheet_counts['sheets'] = sheet_index + 1
+            # Sheets start after the writer's own catalog objects, free slots are written as free xref entries
+            first_idnum = (sheet_index + 1) * self.sheet_object_block
+            writer._objects.extend([None] * (first_idnum - 1 - len(writer._objects)))
+
+        new_page = writer.insert_page(page, writer.get_num_pages())
+
+        for ref, content_hash in refs:
+            idnum = writer._id_translated.get(id(ref.pdf), {}).get(ref.idnum)
+            if idnum is not None:
+                pooled.setdefault(content_hash, idnum)
+        return new_page
+
+    def content_hash(self, obj: PdfObject) -> bytes:
+        if isinstance(obj, IndirectObject):
+            hashes = self._document_table(self._hashes, obj.pdf)
+            if obj.idnum not in hashes:
+                # Placeholder breaks reference cycles, objects in a cycle simply won't be shared
+                hashes[obj.idnum] = repr((id(obj.pdf), obj.idnum)).encode()
+                hashes[obj.idnum] = self.content_hash(obj.get_object())
+            return hashes[obj.idnum]
+
+        digest = hashlib.sha1(type(obj).__name__.encode())
+        if isinstance(obj, DictionaryObject):
+            for k in sorted(obj.keys()):
+                digest.update(k.encode())
+                digest.update(self.content_hash(obj.raw_get(k)))
+            if isinstance(obj, StreamObject):
+                digest.update(obj._data)
+        elif isinstance(obj, ArrayObject):
+            for item in obj:
+                digest.update(self.content_hash(item))
+        else:
+            digest.update(repr(obj).encode())
+        return digest.digest()
+
+
+class VolumeWriter:
+    """
+    Writes signatures to a series of volumes, each kept under a maximum size and/or sheet count.
+
+    Volumes are only split between signatures. Each is written and closed as soon as the next signature would not
+    fit, so the first volumes can be sent to the printer while later signatures are still being imposed.
+    Sizes are judged from each signature written on its own, which overstates a volume that shares fonts and images
+    between signatures, so volumes come out under the limit rather than over it.
+    """
+
+    def __init__(
+            self,
+            output_path: Union[str, Path],
+            max_bytes: Optional[int] = None,
+            max_sheets: Optional[int] = None,
+            linearize: bool = False,
+            document_id: Optional[bytes] = None,
+            resource_pool: Optional[ResourcePool] = None
+    ):
+        self.output_path = Path(output_path)
+        self.max_bytes = max_bytes
+        self.max_sheets = max_sheets
+        self.linearize = linearize
+        self.document_id = document_id
+        self.resource_pool = resource_pool if resource_pool is not None else ResourcePool()
+        self.paths: list[Path] = []
+        self._writer: Optional[PdfWriter] = None
+        self._bytes = 0
+        self._sheets = 0
+
+    def add(self, signature: PdfReader | PdfWriter):
+        size = self.signature_size(signature) if self.max_bytes is not None else 0
+        sheets = len(signature.pages) // 2
+        if self._writer is not None and (
+                (self.max_bytes is not None and self._bytes + size > self.max_bytes)
+                or (self.max_sheets is not None and self._sheets + sheets > self.max_sheets)
+        ):
+            self.flush()
+        if self.max_bytes is not None and size > self.max_bytes:
+            logging.warning(f"Signature of {size} bytes is larger than the {self.max_bytes} byte volume limit")
+        if self.max_sheets is not None and sheets > self.max_sheets:
+            logging.warning(f"Signature of {sheets} sheets is larger than the {self.max_sheets} sheet volume limit")
+
+        if self._writer is None:
+            self._writer = PdfWriter()
+        for page in signature.pages:
+            self.resource_pool.insert_page(self._writer, page)
+        self._bytes += size
+        self._sheets += sheets
+
+    def flush(self):
+        """Write the current volume to disk and start a new one."""
+        if self._writer is None:
+            return
+        path = self.output_path.with_name(f"{self.output_path.stem}_vol{len(self.paths) + 1}{self.output_path.suffix}")
+        with path.open("bw") as fh:
+            write_pdf(
+                self._writer,
+                fh,
+                linearize=self.linearize,
+                document_id=part_document_id(self.document_id, f"volume_{len(self.paths) + 1}")
+            )
+        self._writer.close()
+        logging.info(f"Wrote volume {path}, {self._sheets} sheets, {path.stat().st_size} bytes")
+        self.paths.append(path)
+        self._writer = None
+        self._bytes = 0
+        self._sheets = 0
+
+    def close(self):
+        self.flush()
+
+    @staticmethod
+    def signature_size(signature: PdfReader | PdfWriter) -> int:
+        if isinstance(signature, PdfReader):
+            return signature.stream.seek(0, io.SEEK_END)
+        buffer = io.BytesIO()
+        write_pdf(signature, buffer)
+        return buffer.tell()
+
+
+def page_resource_refs(page: PageObject) -> Generator[IndirectObject, None, None]:
+    """Yields the indirectly referenced fonts, XObjects and graphics states used by a page."""
+    resources = page.get("/Resources")
+    if resources is None:
+        return
+    resources = resources.get_object()
+    for resource_type in POOLED_RESOURCE_TYPES:
+        entries = resources.get(resource_type)
+        if entries is None:
+            continue
+        for value in entries.get_object().values():
+            if isinstance(value, IndirectObject):
+                yield value
+
+
+class SheetMarks:
+    """
+    Printer's marks, drawn once for each sheet geometry as a Form XObject and stamped on every sheet that shares it.
+
+    Crop marks sit just outside the corners of each trim box, leaving out any that would fall on another page or off
+    the sheet. Fold marks are short dashes at the head and foot of each fold. Collation marks are blocks on the spine
+    of each signature's outer sheet, stepped down one place per signature, so a gathered book shows an unbroken
+    staircase down its back.
+    """
+
+    def __init__(self, crop: bool = False, fold: bool = False, collation: bool = False, border: bool = False):
+        self.crop = crop
+        self.fold = fold
+        self.collation = collation
+        self.border = border
+        self._overlays: dict[int, dict[tuple, tuple[IndirectObject, IndirectObject, IndirectObject]]] = {}
+
+    def __bool__(self) -> bool:
+        return self.crop or self.fold or self.collation or self.border
+
+    def stamp(
+            self,
+            writer: PdfWriter,
+            page: PageObject,
+            trim_boxes: list[tuple[float, float, float, float]],
+            fold_lines: tuple[float, ...] = (),
+            collation_slot: Optional[int] = None
+    ):
+        """Draw the marks for a page of writer with the given trim boxes, folds at x positions and collation slot."""
+        if not self:
+            return
+        sheet_box = tuple(round(float(v), 2) for v in page.mediabox)
+        trim_boxes = [tuple(round(float(v), 2) for v in box) for box in trim_boxes]
+        fold_lines = tuple(round(float(x), 2) for x in fold_lines)
+        geometry = (sheet_box, tuple(trim_boxes), fold_lines, collation_slot if self.collation else None)
+
+        if id(writer) not in self._overlays:
+            self._overlays[id(writer)] = {}
+            weakref.finalize(writer, self._overlays.pop, id(writer), None)
+        overlays = self._overlays[id(writer)]
+        if geometry not in overlays:
+            content = self.draw(sheet_box, trim_boxes, fold_lines, collation_slot)
+            overlays[geometry] = create_overlay(writer, sheet_box, content, "/Marks")
+        stamp_overlay(writer, page, overlays[geometry])
+
+    def draw(
+            self,
+            sheet_box: tuple[float, ...],
+            trim_boxes: list[tuple[float, ...]],
+            fold_lines: tuple[float, ...],
+            collation_slot: Optional[int]
+    ) -> bytes:
+        sx0, sy0, sx1, sy1 = sheet_box
+        length = mm_to_pnt(MARK_LENGTH_MM)
+        offset = mm_to_pnt(MARK_OFFSET_MM)
+        ops = [f"{MARK_LINE_WIDTH} w 0 G 0 g"]
+
+        if self.border:
+            for x0, y0, x1, y1 in trim_boxes:
+                ops.append(f"{x0} {y0} {x1 - x0} {y1 - y0} re S")
+
+        if self.crop:
+            def clear(x0, y0, x1, y1):
+                return sx0 <= x0 and x1 <= sx1 and sy0 <= y0 and y1 <= sy1 and not any(
+                    x0 < bx1 and bx0 < x1 and y0 < by1 and by0 < y1 for bx0, by0, bx1, by1 in trim_boxes
+                )
+            for x0, y0, x1, y1 in trim_boxes:
+                for x, y, dx, dy in ((x0, y0, -1, -1), (x1, y0, 1, -1), (x0, y1, -1, 1), (x1, y1, 1, 1)):
+                    horizontal = sorted((x + dx * offset, x + dx * (offset + length)))
+                    vertical = sorted((y + dy * offset, y + dy * (offset + length)))
+                    if clear(horizontal[0], y, horizontal[1], y):
+                        ops.append(f"{horizontal[0]} {y} m {horizontal[1]} {y} l S")
+                    if clear(x, vertical[0], x, vertical[1]):
+                        ops.append(f"{x} {vertical[0]} m {x} {vertical[1]} l S")
+
+        if self.fold and fold_lines:
+            ops.append("q [3 2] 0 d")
+            for x in fold_lines:
+                ops.append(f"{x} {sy1} m {x} {sy1 - length} l S {x} {sy0} m {x} {sy0 + length} l S")
+            ops.append("Q")
+
+        if self.collation and collation_slot is not None and fold_lines:
+            width, height = (mm_to_pnt(v) for v in COLLATION_MARK_SIZE_MM)
+            # Wraps back to the head of the spine once the steps reach the foot
+            step = collation_slot % max(int((sy1 - sy0) // height), 1)
+            ops.append(f"{fold_lines[0] - width / 2} {sy1 - (step + 1) * height} {width} {height} re f")
+
+        return "\n".join(ops).encode()
+
+
+def create_overlay(
+        writer: PdfWriter,
+        bbox: tuple[float, ...],
+        content: bytes,
+        prefix: str
+) -> tuple[IndirectObject, IndirectObject, IndirectObject]:
+    """
+    Add content to writer as a Form XObject, along with the content streams that draw it over a page.
+
+    The XObject is named from a hash of its content, so overlays carried in from pages merged onto a sheet can only
+    share a name with the sheet's own overlay if they draw the same thing.
+
+    Returns
+    -------
+    tuple[IndirectObject, IndirectObject, IndirectObject]
+        The Form XObject, and the streams to place before and after a page's own content.
+    """
+    name = prefix + hashlib.sha1(repr((bbox, content)).encode()).hexdigest()[:12]
+    form = StreamObject()
+    form.update({
+        NameObject("/Type"): NameObject("/XObject"),
+        NameObject("/Subtype"): NameObject("/Form"),
+        NameObject("/BBox"): ArrayObject(FloatObject(v) for v in bbox),
+        NameObject("/Resources"): DictionaryObject(),
+        NameObject("/Name"): NameObject(name),
+    })
+    form.set_data(content)
+    # The page's own content is wrapped in q/Q so any graphics state it leaves behind doesn't move the overlay
+    before = StreamObject()
+    before.set_data(b"q")
+    after = StreamObject()
+    after.set_data(f"Q q {name} Do Q".encode())
+    return writer._add_object(form), writer._add_object(before), writer._add_object(after)
+
+
+def stamp_overlay(
+        writer: PdfWriter,
+        page: PageObject,
+        overlay: tuple[IndirectObject, IndirectObject, IndirectObject]
+):
+    """Draw an overlay from create_overlay over a page of writer, without reading or rewriting its content."""
+    form, before, after = overlay
+    resources = DictionaryObject(page.get("/Resources", DictionaryObject()).get_object())
+    xobjects = DictionaryObject(resources.get("/XObject", DictionaryObject()).get_object())
+    xobjects[form.get_object()["/Name"]] = form
+    resources[NameObject("/XObject")] = xobjects
+    page[NameObject("/Resources")] = resources
+
+    contents = page.raw_get("/Contents") if "/Contents" in page else ArrayObject()
+    if isinstance(contents.get_object(), ArrayObject):
+        contents = list(contents.get_object())
+    elif isinstance(contents, IndirectObject):
+        contents = [contents]
+    else:
+        contents = [writer._add_object(contents)]
+    page[NameObject("/Contents")] = ArrayObject([before, *contents, after])
+
+
+def transform_box(box: RectangleObject, transformation: Transformation) -> tuple[float, float, float, float]:
+    xs, ys = zip(*(
+        transformation.apply_on((float(x), float(y)))
+        for x, y in ((box.left, box.bottom), (box.right, box.bottom), (box.left, box.top), (box.right, box.top))
+    ))
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def add_lines(reader: PdfReader | PdfWriter | SubsetReader, line_page_index: int) -> PdfWriter:
+    """Draw trim lines along the top and right edges of one page."""
+    logging.debug("Adding lines")
+
+    writer = PdfWriter()
+    for page in reader.pages:
+        writer.add_page(page)
+    page = writer.pages[line_page_index]
+    x0, y0, x1, y1 = (float(v) for v in page.mediabox)
+    content = f"{SIDE_LINE_WIDTH} w {x0} {y1} m {x1} {y1} l {x1} {y0} l S".encode()
+    stamp_overlay(writer, page, create_overlay(writer, (x0, y0, x1, y1), content, "/Lines"))
+    return writer
+
+
+def add_lines_to_last_page(reader: SubsetReader) -> SubsetReader:
+    """Draw the trim lines on the last page of a subset, leaving every other page to be read from the input."""
+    lined_page = add_lines(reader.subset([reader.page_indexes[-1]]), 0).pages[0]
+    return reader.replace_page(reader.get_num_pages() - 1, lined_page)
+
+
+def add_border(
+        reader: PdfReader | PdfWriter | SubsetReader,
+        page_indexes: Optional[set[int]] = None,
+        width: Optional[float] = None,
+        height: Optional[float] = None
+) -> PdfWriter:
+    """Draw a border on the given pages, or every page if None. Width and height default to the page size."""
+    logging.debug("Adding borders")
+
+    writer = PdfWriter()
+    marks = SheetMarks(border=True)
+    for i, page in enumerate(reader.pages):
+        page = writer.add_page(page)
+        if page_indexes is None or i in page_indexes:
+            x0, y0, x1, y1 = (float(v) for v in page.mediabox)
+            x1 = x1 if width is None else x0 + width
+            y0 = y0 if height is None else y1 - height
+            marks.stamp(writer, page, [(x0, y0, x1, y1)])
+    return writer
+
+
+def alt_flip(document: PdfReader | PdfWriter | SubsetReader) -> PdfWriter:
+    """Turn every other page upside down, for head-to-tail printing."""
+    writer = PdfWriter()
+    for i, page in enumerate(document.pages):
+        new_page = writer.add_page(page)
+        if i % 2 == 1:
+            new_page.rotate(180)
+    return writer
+
+
+def merge_documents(documents: list[PdfReader | PdfWriter]) -> PdfWriter:
+    """Merge the pages of several documents into one, sharing their resources."""
+    merger = PdfWriter()
+    resource_pool = ResourcePool()
+    for document in documents:
+        for page in document.pages:
+            resource_pool.insert_page(merger, page)
+    return merger
+
+
+def create_book(
+        reader: PdfReader | PdfWriter | SubsetReader,
+        signature_sizes: list[int],
+        progress_bar: Optional[wx.Gauge] = None
+) -> PdfWriter:
+    """Impose a whole document as signatures of the given number of sheets, merged into one document."""
+    return merge_documents(
+        [create_signature(reader, page_range, progress_bar) for page_range in get_signature_page_indexes(signature_sizes)]
+    )
+
 
-    return start, end
+def parse_page_selection(selection_str: str, max_page: int) -> list[int]:
+    """
+    Parse a page selection such as "1-16, 33-48, 101-" into page indexes.
+
+    Parameters
+    ----------
+    selection_str: str
+        Comma separated page numbers or ranges, counting from 1. An open start or end runs to the first or last page.
+    max_page: int
+        Number of pages in the document.
+
+    Returns
+    -------
+    list[int]
+        Zero based index of each selected page, in the order given.
+    """
+    page_indexes: list[int] = []
+    for part in selection_str.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            p1, p2 = (p.strip() for p in part.split("-", 1))
+            start = int(p1) if p1 else 1
+            end = int(p2) if p2 else max_page
+        else:
+            start = end = int(part)
+        if not 1 <= start <= end <= max_page:
+            raise ValueError(f"Page range '{part}' is outside of 1-{max_page}.")
+        page_indexes.extend(range(start - 1, end))
+
+    if not page_indexes:
+        raise ValueError("No pages selected.")
+    return page_indexes
+
+
+def parse_blank_positions(positions_str: str, max_page: int) -> list[int]:
+    """Parse the pages to put a blank after, such as "0, 12, 12", counting from 1 with 0 for before the first."""
+    positions: list[int] = []
+    for part in positions_str.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        position = int(part)
+        if not 0 <= position <= max_page:
+            raise ValueError(f"Blank page position '{part}' is outside of 0-{max_page}.")
+        positions.append(position)
+    return positions
+
+
+def pad_page_selection(
+        page_indexes: list[int],
+        mode: str = "end",
+        after_pages: Optional[list[int]] = None
+) -> list[Optional[int]]:
+    """
+    Pad a page selection with blank pages, as None, to a multiple of 4 pages.
+
+    Parameters
+    ----------
+    page_indexes: list[int]
+        The selection, as from parse_page_selection.
+    mode: str
+        One of PADDING_MODES; blanks go at the end, before the last page, or after each of after_pages.
+    after_pages: Optional[list[int]]
+        For "after_pages", the pages of the selection to put a blank after, as from parse_blank_positions. A page
+        listed twice gets two blanks. Any blanks still needed to make a multiple of 4 go at the end.
+    """
+    if mode not in PADDING_MODES:
+        raise ValueError(f"Unknown padding mode '{mode}'.")
+    padded: list[Optional[int]] = list(page_indexes)
+    if mode == "after_pages":
+        # Insert from the back so earlier positions still count pages of the selection
+        for position in sorted(after_pages or [], reverse=True):
+            padded.insert(position, None)
+    blanks = [None] * (-len(padded) % 4)
+    if mode == "before_back_cover" and padded:
+        return padded[:-1] + blanks + padded[-1:]
+    return padded + blanks
+
+
+def parse_reprint_selection(selection_str: str, signature_sizes: list[int]) -> dict[int, Optional[set[int]]]:
+    """
+    Parse a reprint selection such as "2, 4-5, 7:1-2, 9:3" into the sheets to make of each signature.
+
+    Parameters
+    ----------
+    selection_str: str
+        Comma separated signature numbers or ranges, counting from 1. A signature can be followed by a colon and
+        sheet numbers or ranges within it, also counting from 1 from the outer sheet in.
+    signature_sizes: list[int]
+        Number of sheets in each signature.
+
+    Returns
+    -------
+    dict[int, Optional[set[int]]]
+        Sheet numbers of each selected signature by zero based index, None where the whole signature is wanted.
+    """
+    def parse_range(part: str, maximum: int, what: str) -> range:
+        first, _, last = (p.strip() for p in part.partition("-"))
+        start = int(first) if first else 1
+        end = int(last) if last else (maximum if "-" in part else start)
+        if not 1 <= start <= end <= maximum:
+            raise ValueError(f"{what} '{part}' is outside of 1-{maximum}.")
+        return range(start, end + 1)
+
+    selection: dict[int, Optional[set[int]]] = {}
+    for part in selection_str.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        sig_part, has_sheets, sheet_part = part.partition(":")
+        for sig in parse_range(sig_part.strip(), len(signature_sizes), "Signature"):
+            if not has_sheets:
+                selection[sig - 1] = None
+            elif selection.get(sig - 1, set()) is not None:
+                sheets = set(parse_range(sheet_part.strip(), signature_sizes[sig - 1], "Sheet"))
+                selection[sig - 1] = selection.get(sig - 1, set()) | sheets
+
+    if not selection:
+        raise ValueError("No signatures selected.")
+    return selection
+
+
+def preflight(path: Union[str, Path], page_indexes: list[int]) -> dict[str, Any]:
+    """Scan the selected pages of a document once, collecting what the operator and cost model need to know."""
+    if Path(path).is_dir():
+        return preflight_images(path, page_indexes)
+    doc = pymupdf.open(path)
+    page_sizes: Counter[tuple[float, float]] = Counter()
+    content_bytes = 0
+    image_count = 0
+    min_image_dpi: Optional[float] = None
+    source_indexes = [i for i in page_indexes if i is not None]
+    for index in source_indexes:
+        page = doc.load_page(index)
+        page_sizes[(round(page.rect.width, 1), round(page.rect.height, 1))] += 1
+        content_bytes += len(page.read_contents())
+        for image in page.get_image_info():
+            image_count += 1
+            drawn_width = image['bbox'][2] - image['bbox'][0]
+            if drawn_width > 0:
+                dpi = image['width'] / (drawn_width / 72)
+                min_image_dpi = dpi if min_image_dpi is None else min(min_image_dpi, dpi)
+
+    report = {
+        'num_pages': len(page_indexes),
+        'source_pages': len(doc),
+        'file_bytes': os.path.getsize(path),
+        'page_sizes': page_sizes,
+        'blank_pages': len(page_indexes) - len(source_indexes),
+        'first_page_height': doc.load_page(source_indexes[0]).rect.height if source_indexes else 0,
+        'content_bytes': content_bytes,
+        'image_count': image_count,
+        'min_image_dpi': min_image_dpi,
+    }
+    doc.close()
+    return report
+
+
+def preflight_images(path: Union[str, Path], page_indexes: list[int]) -> dict[str, Any]:
+    """As preflight, for a directory of page images, reading only their headers."""
+    image_paths = list_page_images(path)
+    page_sizes: Counter[tuple[float, float]] = Counter()
+    min_image_dpi: Optional[float] = None
+    first_page_height = 0
+    source_indexes = [i for i in page_indexes if i is not None]
+    for index in source_indexes:
+        with open(image_paths[index], "rb") as fh:
+            info = read_image_info(fh)
+        size = (round(info['width'] * 72 / info['dpi'][0], 1), round(info['height'] * 72 / info['dpi'][1], 1))
+        page_sizes[size] += 1
+        first_page_height = first_page_height or size[1]
+        min_image_dpi = min(info['dpi']) if min_image_dpi is None else min(min_image_dpi, *info['dpi'])
+
+    return {
+        'num_pages': len(page_indexes),
+        'source_pages': len(image_paths),
+        'file_bytes': sum(p.stat().st_size for p in image_paths),
+        'page_sizes': page_sizes,
+        'blank_pages': len(page_indexes) - len(source_indexes),
+        'first_page_height': first_page_height,
+        'content_bytes': 0,
+        'image_count': len(source_indexes),
+        'min_image_dpi': min_image_dpi,
+    }
+
+
+def estimate_job_cost(
+        report: dict[str, Any],
+        add_side_lines: bool = False,
+        double_up_height_mm: Optional[float] = None
+) -> dict[str, Any]:
+    """
+    Estimate the runtime of each stage, peak memory and output size of a job from its preflight report.
+
+    Returns
+    -------
+    dict[str, Any]
+        'stage_seconds' in pipeline order, 'peak_memory_bytes', 'output_bytes' and, when doubling up,
+        the 'double_up_scale' and lowest 'effective_dpi' of any image after scaling.
+    """
+    num_pages = report['num_pages']
+    content_mb = report['content_bytes'] / 1e6
+    stages = ['signature', 'merge', 'write']
+    if add_side_lines:
+        stages.insert(0, 'lines')
+    if double_up_height_mm is not None:
+        stages.insert(stages.index('merge'), 'double_up')
+    stage_seconds = {
+        stage: COST_MODEL[stage][0] * num_pages + COST_MODEL[stage][1] * content_mb for stage in stages
+    }
+
+    # Fonts and images are carried across once, roughly in proportion to the pages used
+    resource_bytes = report['file_bytes'] * num_pages / max(report['source_pages'], 1)
+    output_factor = COST_MODEL_OUTPUT_PER_CONTENT_BYTE['double_up' if double_up_height_mm else 'signature']
+    estimate = {
+        'stage_seconds': stage_seconds,
+        'peak_memory_bytes': (COST_MODEL_BASE_MEMORY_MB + COST_MODEL_MEMORY_PER_CONTENT_MB * content_mb) * 1e6,
+        'output_bytes': resource_bytes + output_factor * report['content_bytes'],
+    }
+    if double_up_height_mm is not None and report['first_page_height']:
+        scale = mm_to_pnt(double_up_height_mm) / report['first_page_height']
+        estimate['double_up_scale'] = scale
+        if report['min_image_dpi'] is not None:
+            estimate['effective_dpi'] = report['min_image_dpi'] / scale
+    return estimate
+
+
+def format_preflight(report: dict[str, Any], estimate: dict[str, Any]) -> str:
+    lines = [f"{report['num_pages']} pages of {report['source_pages']}, {report['content_bytes'] / 1e6:.1f}MB content"]
+    if report.get('blank_pages'):
+        lines[0] += f", {report['blank_pages']} blank pages added"
+    if len(report['page_sizes']) > 1:
+        sizes = ", ".join(f"{w}x{h} ({n})" for (w, h), n in report['page_sizes'].most_common())
+        lines.append(f"Mixed page sizes: {sizes}")
+    images = f"{report['image_count']} images"
+    if 'effective_dpi' in estimate:
+        images += f", lowest {estimate['effective_dpi']:.0f} dpi after {estimate['double_up_scale']:.0%} double up"
+    elif report['min_image_dpi'] is not None:
+        images += f", lowest {report['min_image_dpi']:.0f} dpi"
+    lines.append(images)
+    lines.append(", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in estimate['stage_seconds'].items()))
+    lines.append(
+        f"Estimated {sum(estimate['stage_seconds'].values()):.0f}s, "
+        f"{estimate['peak_memory_bytes'] / 1e6:.0f}MB peak memory, {estimate['output_bytes'] / 1e6:.1f}MB output"
+    )
+    return "\n".join(lines)
+
+
+def impose_signatures(
+        reader: PdfReader | PdfWriter | SubsetReader,
+        signature_sizes: list[int],
+        checkpoint: Optional[JobCheckpoint] = None,
+        double_up_height_mm: Optional[float] = None,
+        center_margin_mm: Optional[float] = None,
+        cut_and_stack: bool = False,
+        layout: Optional[dict[str, Any]] = None,
+        marks: Optional[SheetMarks] = None,
+        prepared: Optional[dict[int, PdfReader | PdfWriter]] = None,
+        timer: Optional[StageTimer] = None,
+        progress_bar: Optional[wx.Gauge] = None
+) -> Generator[PdfReader | PdfWriter, None, None]:
+    """
+    Yield each finished signature in turn, doubled up if a double_up_height_mm is given, or placed on press sheets
+    by a layout from plan_sheet_layout.
+
+    With cut_and_stack each press sheet carries a different signature in each of its places, grouped as
+    plan_cut_and_stack, rather than copies of one.
+
+    Signatures are imposed only as they are asked for, so each can be written out before the next is started.
+    Any already made, such as by a SpeculativeImposer, can be given by index in prepared. Time spent imposing is
+    added to timer under "signature", "double_up" and "n_up".
+    """
+    page_ranges = get_signature_page_indexes(signature_sizes)
+    timer = timer or StageTimer()
+
+    def make_signature(i: int) -> PdfReader | PdfWriter:
+        with timer.stage("signature"):
+            if prepared is not None and i in prepared:
+                signature = prepared[i]
+            else:
+                signature = checkpoint.load("signature", i) if checkpoint is not None else None
+            if signature is None:
+                signature = create_signature(reader, page_ranges[i], progress_bar, marks=marks, signature_index=i)
+                if checkpoint is not None:
+                    checkpoint.save("signature", i, signature)
+            elif progress_bar is not None:
+                progress_bar.SetValue(progress_bar.GetValue() + len(signature.pages))
+        return signature
+
+    if layout is not None:
+        ways = layout['columns'] * layout['rows']
+        if cut_and_stack:
+            groups = plan_cut_and_stack(signature_sizes, ways)
+        else:
+            groups = [(i,) * ways for i in range(len(signature_sizes))]
+        for i, group in enumerate(groups):
+            with timer.stage("n_up"):
+                placed = checkpoint.load("n_up", i) if checkpoint is not None else None
+                if placed is None:
+                    signatures = {k: make_signature(k) for k in dict.fromkeys(group) if k is not None}
+                    placed = create_n_up(
+                        [signatures.get(k) for k in group], layout, marks=marks, progress_bar=progress_bar
+                    )
+                    if checkpoint is not None:
+                        checkpoint.save("n_up", i, placed)
+                elif progress_bar is not None:
+                    progress_bar.SetValue(progress_bar.GetValue() + len(placed.pages))
+            yield placed
+        return
+
+    if double_up_height_mm is None:
+        for i in range(len(signature_sizes)):
+            yield make_signature(i)
+        return
+
+    pairs = plan_cut_and_stack(signature_sizes) if cut_and_stack else [(i, i) for i in range(len(signature_sizes))]
+    if cut_and_stack:
+        blank_halves = sum(
+            abs(signature_sizes[top] - (signature_sizes[bottom] if bottom is not None else 0)) for top, bottom in pairs
+        )
+        logging.info(f"Cut and stack leaves {blank_halves} half sheets blank")
+    for i, (top, bottom) in enumerate(pairs):
+        with timer.stage("double_up"):
+            doubled_up = checkpoint.load("double_up", i) if checkpoint is not None else None
+            if doubled_up is None:
+                top_signature = make_signature(top)
+                if not cut_and_stack:
+                    bottom_signature = None
+                elif bottom is None:
+                    bottom_signature = PdfWriter()
+                else:
+                    bottom_signature = make_signature(bottom)
+                doubled_up = create_double_up(
+                    top_signature,
+                    target_height_mm=double_up_height_mm,
+                    progress_bar=progress_bar,
+                    center_margin_mm=center_margin_mm,
+                    marks=marks,
+                    bottom_document=bottom_signature
+                )
+                if checkpoint is not None:
+                    checkpoint.save("double_up", i, doubled_up)
+            elif progress_bar is not None:
+                progress_bar.SetValue(progress_bar.GetValue() + len(doubled_up.pages))
+        yield doubled_up
+
+
+def plan_cut_and_stack(signature_sizes: list[int], ways: int = 2) -> list[tuple[Optional[int], ...]]:
+    """
+    Group signatures for cut-and-stack printing, ways to a sheet.
+
+    Place j of sheet k carries signature k + j * ceil(n / ways), so for double up signature k sits on the top half
+    with k + n/2 on the bottom. Once printed the stack is cut apart and the piles laid on each other in place
+    order, which leaves every signature in order. Where the signatures run out places are left empty, as None.
+    """
+    stride = ceil(len(signature_sizes) / ways)
+    return [
+        tuple(k + j * stride if k + j * stride < len(signature_sizes) else None for j in range(ways))
+        for k in range(stride)
+    ]
+
+
+def create_reprint(
+        reader: SubsetReader,
+        signature_sizes: list[int],
+        selection: dict[int, Optional[set[int]]],
+        add_side_lines: bool = False,
+        double_up_height_mm: Optional[float] = None,
+        center_margin_mm: Optional[float] = None,
+        cut_and_stack: bool = False,
+        layout: Optional[dict[str, Any]] = None,
+        marks: Optional[SheetMarks] = None
+) -> PdfWriter:
+    """
+    Impose only the selected sheets of a job, exactly as the full job would make them.
+
+    Only the pages on those sheets are read from the input. Selection is as returned by parse_reprint_selection.
+    With cut_and_stack the whole press sheet is made again, so a selected sheet comes with its partners.
+    """
+    if add_side_lines:
+        last_index = reader.get_num_pages() - 1
+        page_ranges = get_signature_page_indexes(signature_sizes)
+        if any(
+                last_index in (left, right)
+                for i, sheets in selection.items()
+                for side, (left, right) in enumerate(gen_signature_page_orderings(page_ranges[i]))
+                if sheets is None or side // 2 + 1 in sheets
+        ):
+            reader = add_lines_to_last_page(reader)
+
+    page_ranges = get_signature_page_indexes(signature_sizes)
+    writer = PdfWriter()
+    resource_pool = ResourcePool()
+    if layout is None and (double_up_height_mm is None or not cut_and_stack):
+        for i in sorted(selection):
+            signature = create_signature(reader, page_ranges[i], marks=marks, signature_index=i, sheets=selection[i])
+            if double_up_height_mm is not None:
+                signature = create_double_up(
+                    signature, target_height_mm=double_up_height_mm, center_margin_mm=center_margin_mm, marks=marks
+                )
+            for page in signature.pages:
+                resource_pool.insert_page(writer, page)
+        return writer
+
+    ways = 2 if layout is None else layout['columns'] * layout['rows']
+    if cut_and_stack:
+        groups = plan_cut_and_stack(signature_sizes, ways)
+    else:
+        groups = [(i,) * ways for i in range(len(signature_sizes))]
+    for group in groups:
+        selected = [selection[k] for k in dict.fromkeys(group) if k in selection]
+        if not selected:
+            continue
+        sheets = None if None in selected else set().union(*selected)
+        signatures = {
+            k: create_signature(reader, page_ranges[k], marks=marks, signature_index=k, sheets=sheets)
+            for k in dict.fromkeys(group) if k is not None
+        }
+        if layout is not None:
+            placed = create_n_up([signatures.get(k) for k in group], layout, marks=marks)
+        else:
+            placed = create_double_up(
+                signatures[group[0]],
+                target_height_mm=double_up_height_mm,
+                center_margin_mm=center_margin_mm,
+                marks=marks,
+                bottom_document=signatures.get(group[1], PdfWriter())
+            )
+        for page in placed.pages:
+            resource_pool.insert_page(writer, page)
+    return writer
 
 
 def create_signature(
         reader: PdfReader,
         pages: tuple[int, int],
-        progress_bar: Optional[wx.Gauge] = None
+        progress_bar: Optional[wx.Gauge] = None,
+        marks: Optional[SheetMarks] = None,
+        signature_index: int = 0,
+        sheets: Optional[set[int]] = None
 ) -> PdfWriter:
+    """
+    Impose the pages in the inclusive range pages as a signature, outer sheet first.
+
+    Given sheets, counted from 1, only those sheets are made and only their pages are read.
+    """
     page_width = reader.pages[0].mediabox.width
     page_height = reader.pages[0].mediabox.height
     new_sheet_size = (2 * page_width, page_height)
@@ -490,17 +2717,33 @@ def create_signature(
         ty = (new_sheet_size[1] - page_height) // 2
     )
 
-    for left_index, right_index in gen_signature_page_orderings(pages):
+    trim_boxes = [transform_box(reader.pages[0].mediabox, t) for t in (left_transform, right_transform)]
+
+    for sheet_side, (left_index, right_index) in enumerate(gen_signature_page_orderings(pages)):
+        if sheets is not None and sheet_side // 2 + 1 not in sheets:
+            continue
         new_pdf.add_blank_page(*new_sheet_size)
         new_page = new_pdf.pages[-1]
         try:
             logging.debug(f"Reading pages: {left_index}, {right_index}")
-            new_page.merge_transformed_page(reader.pages[left_index], left_transform)
-            new_page.merge_transformed_page(reader.pages[right_index], right_transform)
+            for index, transform in ((left_index, left_transform), (right_index, right_transform)):
+                page = reader.pages[index]
+                # Blank padding has nothing to draw, leave its half of the sheet empty
+                if "/Contents" in page:
+                    new_page.merge_transformed_page(page, transform)
         except IndexError as e:
             logging.exception(e)
             logging.error(f"Attempted to read pages: {left_index}, {right_index}")
             raise e
+        if marks:
+            # The first side is the outside of the outer sheet, which forms the spine of the signature
+            marks.stamp(
+                new_pdf,
+                new_page,
+                trim_boxes,
+                fold_lines=(new_sheet_size[0] / 2,),
+                collation_slot=signature_index if sheet_side == 0 else None
+            )
 
         if progress_bar is not None:
             progress_bar.SetValue(progress_bar.GetValue() + 1)
@@ -514,13 +2757,248 @@ def create_double_up(
         output_size: Dimensions = PaperSize.A4,
         target_height_mm: Optional[float] = None,
         progress_bar: Union[None, wx.Gauge] = None,
+        center_margin_mm: Optional[int] = None,
+        marks: Optional[SheetMarks] = None,
+        bottom_document: Union[None, PdfReader, PdfWriter] = None
+) -> PdfWriter:
+    """
+    Place each page of document twice on a sheet, or with bottom_document, each page over the matching page of
+    bottom_document for cut-and-stack. Where either document runs out first its half of the sheet is left blank.
+    """
+    writer = PdfWriter()
+    if bottom_document is None:
+        bottom_document = document
+    page_size = (document.pages[0] if len(document.pages) else bottom_document.pages[0]).mediabox
+    top_transform, bottom_transform = get_double_up_transforms(
+        page_size, output_size, target_height_mm, center_margin_mm
+    )
+    trim_boxes = [transform_box(page_size, t) for t in (top_transform, bottom_transform)]
+    num_bottom_pages = len(bottom_document.pages)
+
+    for i in range(max(len(document.pages), num_bottom_pages)):
+        writer.add_blank_page(output_size.width, output_size.height)
+        new_page = writer.pages[len(writer.pages) - 1]
+        if i < len(document.pages):
+            new_page.merge_transformed_page(document.pages[i], top_transform)
+        if i < num_bottom_pages:
+            new_page.merge_transformed_page(bottom_document.pages[i], bottom_transform)
+        if marks:
+            marks.stamp(writer, new_page, trim_boxes)
+
+        if progress_bar is not None:
+            progress_bar.SetValue(progress_bar.GetValue() + 1)
+            wx.Yield()
+
+    return writer
+
+
+def create_multi_page(
+        document: PdfReader | PdfWriter | SubsetReader,
+        output_size: Dimensions = PaperSize.A4,
+        target_height_mm: Optional[float] = None,
+        progress_bar: Union[None, wx.Gauge] = None,
         center_margin_mm: Optional[int] = None
 ) -> PdfWriter:
+    """
+    Place pages two to a side, laid out as create_double_up does.
+
+    Each group of four pages makes one sheet, pages 1 and 2 on the lower half of the front and back and pages 3 and 4
+    on the upper half. A short final group leaves its places blank.
+    """
+    writer = PdfWriter()
+    top_transform, bottom_transform = get_double_up_transforms(
+        document.pages[0].mediabox, output_size, target_height_mm, center_margin_mm
+    )
+
+    num_pages = len(document.pages)
+    for first in range(0, num_pages, 4):
+        for lower, upper in ((first, first + 2), (first + 1, first + 3)):
+            writer.add_blank_page(output_size.width, output_size.height)
+            new_page = writer.pages[len(writer.pages) - 1]
+            if lower < num_pages:
+                new_page.merge_transformed_page(document.pages[lower], bottom_transform)
+            if upper < num_pages:
+                new_page.merge_transformed_page(document.pages[upper], top_transform)
+
+        if progress_bar is not None:
+            progress_bar.SetValue(progress_bar.GetValue() + 1)
+            wx.Yield()
+
+    return writer
+
+
+def create_n_up(
+        documents: list[Union[None, PdfReader, PdfWriter]],
+        layout: dict[str, Any],
+        marks: Optional[SheetMarks] = None,
+        progress_bar: Optional[wx.Gauge] = None
+) -> PdfWriter:
+    """
+    Place the pages of each document in its own place of a layout from plan_sheet_layout, one sheet side per page.
+
+    Backs are mirrored across the sheet so each page lines up with its other side. Places with no document, or
+    whose document has run out of pages, are left blank.
+    """
     writer = PdfWriter()
+    documents = [d if d is not None else PdfWriter() for d in documents]
+    page_size = next(d.pages[0] for d in documents if len(d.pages)).mediabox
+    front_transforms = get_layout_transforms(page_size, layout)
+    back_transforms = get_layout_transforms(page_size, layout, back=True)
+    sheet_size = layout['sheet_size']
+
+    for i in range(max(len(d.pages) for d in documents)):
+        writer.add_blank_page(sheet_size.width, sheet_size.height)
+        new_page = writer.pages[-1]
+        transforms = back_transforms if i % 2 else front_transforms
+        for document, transform in zip(documents, transforms):
+            if i < len(document.pages):
+                new_page.merge_transformed_page(document.pages[i], transform)
+        if marks:
+            marks.stamp(writer, new_page, [transform_box(page_size, t) for t in transforms])
+
+        if progress_bar is not None:
+            progress_bar.SetValue(progress_bar.GetValue() + 1)
+            wx.Yield()
+
+    return writer
+
+
+def plan_sheet_layout(
+        item_size: tuple[float, float],
+        signature_sizes: list[int],
+        stock_sizes: dict[str, Dimensions],
+        margin_mm: float = 0,
+        gutter_mm: float = 0,
+        scale: float = 1,
+        cut_and_stack: bool = True
+) -> Optional[dict[str, Any]]:
+    """
+    Find the stock size, number up and rotation that prints a copy of a job on the fewest press sheets.
+
+    Each stock size is tried with signature sheets of item_size, scaled by scale, both upright and turned a quarter
+    turn, in as many rows and columns as fit inside the margin. With cut_and_stack each place carries its own stack
+    of signatures as plan_cut_and_stack, making one copy; without, every place carries the same signature, making a
+    copy per place from a press sheet per signature sheet. Ties go to the layout wasting the least paper.
+
+    Returns
+    -------
+    Optional[dict[str, Any]]
+        'stock', 'sheet_size', 'columns', 'rows', 'rotated', 'scale', 'cells' as the lower left corner of each place
+        from the top row down, 'press_sheets' and 'copies' as the job will print them, and 'waste' as the fraction
+        of the printed paper left blank. None if no stock size fits a single signature sheet.
+    """
+    margin = mm_to_pnt(margin_mm)
+    gutter = mm_to_pnt(gutter_mm)
+    item_area = item_size[0] * item_size[1] * scale ** 2
+    total_sides = 2 * sum(signature_sizes)
+    best = None
+    best_key = None
+    for name, stock in stock_sizes.items():
+        for rotated in (False, True):
+            width, height = (item_size[1], item_size[0]) if rotated else item_size
+            width, height = width * scale, height * scale
+            columns = floor((stock.width - 2 * margin + gutter) / (width + gutter))
+            rows = floor((stock.height - 2 * margin + gutter) / (height + gutter))
+            if columns < 1 or rows < 1:
+                continue
+            if cut_and_stack:
+                groups = plan_cut_and_stack(signature_sizes, columns * rows)
+                press_sheets = sum(max(signature_sizes[i] for i in group if i is not None) for group in groups)
+                copies = 1
+            else:
+                press_sheets = sum(signature_sizes)
+                copies = columns * rows
+            waste = 1 - (copies * total_sides * item_area) / (2 * press_sheets * stock.width * stock.height)
+            # Compared per copy, as without cut and stack every layout prints the same number of press sheets
+            key = (press_sheets / copies, waste)
+            if best is not None and key >= best_key:
+                continue
+            best_key = key
+
+            left = (stock.width - columns * width - (columns - 1) * gutter) / 2
+            bottom = (stock.height - rows * height - (rows - 1) * gutter) / 2
+            best = {
+                'stock': name,
+                'sheet_size': stock,
+                'columns': columns,
+                'rows': rows,
+                'rotated': rotated,
+                'scale': scale,
+                'cells': [
+                    (left + column * (width + gutter), bottom + (rows - 1 - row) * (height + gutter))
+                    for row in range(rows) for column in range(columns)
+                ],
+                'press_sheets': press_sheets,
+                'copies': copies,
+                'waste': waste,
+            }
+    return best
+
+
+def get_layout_transforms(
+        page_size: RectangleObject,
+        layout: dict[str, Any],
+        back: bool = False
+) -> list[Transformation]:
+    """
+    Transformations placing a page in each place of a layout, in the order of layout['cells'].
 
+    For backs the columns are mirrored, and turned pages are turned the other way, so that each back sits behind
+    its front once the sheet is turned over.
+    """
+    transforms = []
+    columns = layout['columns']
+    for i in range(len(layout['cells'])):
+        row, column = divmod(i, columns)
+        x, y = layout['cells'][row * columns + (columns - 1 - column if back else column)]
+        transform = Transformation().scale(layout['scale'], layout['scale'])
+        if layout['rotated']:
+            transform = transform.rotate(-90 if back else 90)
+        x0, y0, _, _ = transform_box(page_size, transform)
+        transforms.append(transform.translate(x - x0, y - y0))
+    return transforms
+
+
+def parse_stock_sizes(stock_str: str) -> dict[str, Dimensions]:
+    """Parse a list of stock sizes such as "A4, SRA3, 330x480", named from STOCK_SIZES or as width x height in mm."""
+    stock_sizes: dict[str, Dimensions] = {}
+    for part in stock_str.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if part.upper() in STOCK_SIZES:
+            stock_sizes[part.upper()] = STOCK_SIZES[part.upper()]
+            continue
+        try:
+            width_mm, height_mm = (float(v) for v in part.lower().split("x"))
+        except ValueError:
+            raise ValueError(f"Unknown stock size '{part}'.")
+        stock_sizes[part] = Dimensions(round(mm_to_pnt(width_mm)), round(mm_to_pnt(height_mm)))
+
+    if not stock_sizes:
+        raise ValueError("No stock sizes given.")
+    return stock_sizes
+
+
+def format_sheet_layout(layout: dict[str, Any]) -> str:
+    turned = ", turned" if layout['rotated'] else ""
+    copies = f" making {layout['copies']} copies" if layout['copies'] > 1 else ""
+    return (
+        f"Best layout: {layout['stock']}, {layout['columns']}x{layout['rows']} up{turned}, "
+        f"{layout['press_sheets']} press sheets{copies}, {layout['waste']:.0%} waste"
+    )
+
+
+def get_double_up_transforms(
+        page_size: RectangleObject,
+        output_size: Dimensions,
+        target_height_mm: float,
+        center_margin_mm: Optional[float] = None
+) -> tuple[Transformation, Transformation]:
+    """Transformations placing a page, scaled to target_height_mm, on the top and bottom halves of output_size."""
     target_height_points = mm_to_pnt(target_height_mm)
-    scale = target_height_points / document.pages[0].mediabox.height
-    scaled_size = document.pages[0].mediabox.width * scale, document.pages[0].mediabox.height * scale
+    scale = target_height_points / page_size.height
+    scaled_size = page_size.width * scale, page_size.height * scale
 
     if center_margin_mm is None:
         logging.debug("Placing double up pages equally spaced")
@@ -535,18 +3013,458 @@ def create_double_up(
 
     top_transform = Transformation().scale(scale, scale).translate(x, top_y)
     bottom_transform = Transformation().scale(scale, scale).translate(x, bottom_y)
+    return top_transform, bottom_transform
 
-    for original_page in document.pages:
-        writer.add_blank_page(output_size.width, output_size.height)
-        new_page = writer.pages[len(writer.pages) - 1]
-        new_page.merge_transformed_page(original_page, top_transform)
-        new_page.merge_transformed_page(original_page, bottom_transform)
+
+def plan_gang_layout(
+        item_sizes: list[tuple[float, float]],
+        sheet_size: Dimensions,
+        gutter: float = 0
+) -> list[list[tuple[int, float, float]]]:
+    """
+    Pack items onto as few sheets as possible, first fit by decreasing height into shelves.
+
+    Each shelf runs the full width of the sheet, so the sheet can be cut apart with straight cuts between shelves
+    and then between the items on each shelf.
+
+    Parameters
+    ----------
+    item_sizes: list[tuple[float, float]]
+        Width and height of each item.
+    sheet_size: Dimensions
+        Size of the sheets to pack onto.
+    gutter: float
+        Space to leave between items for the cuts.
+
+    Returns
+    -------
+    list[list[tuple[int, float, float]]]
+        For each sheet, the index and bottom left x, y position of each item placed on it.
+    """
+    sheets: list[list[tuple[int, float, float]]] = []
+    # Shelves of each sheet as [bottom y, height, used width]
+    sheet_shelves: list[list[list[float]]] = []
+
+    for index in sorted(range(len(item_sizes)), key=lambda i: item_sizes[i][1], reverse=True):
+        width, height = item_sizes[index]
+        if width > sheet_size.width or height > sheet_size.height:
+            raise ValueError(f"Item of {width}x{height} does not fit on a {sheet_size.width}x{sheet_size.height} sheet.")
+
+        placed = False
+        for placements, shelves in zip(sheets, sheet_shelves):
+            for shelf in shelves:
+                x = shelf[2] + gutter if shelf[2] else 0
+                if height <= shelf[1] and x + width <= sheet_size.width:
+                    placements.append((index, x, shelf[0]))
+                    shelf[2] = x + width
+                    placed = True
+                    break
+            if placed:
+                break
+            top = shelves[-1][0] + shelves[-1][1] + gutter
+            if top + height <= sheet_size.height:
+                shelves.append([top, height, width])
+                placements.append((index, 0, top))
+                placed = True
+                break
+
+        if not placed:
+            sheets.append([(index, 0, 0)])
+            sheet_shelves.append([[0, height, width]])
+
+    return sheets
+
+
+def create_gang(
+        booklets: list[PdfReader | PdfWriter],
+        sheet_size: Dimensions = PaperSize.A3,
+        gutter_mm: float = 0,
+        progress_bar: Optional[wx.Gauge] = None,
+        marks: Optional[SheetMarks] = None
+) -> tuple[PdfWriter, int]:
+    """
+    Gang the imposed sheets of several booklets onto shared press sheets.
+
+    Booklet pages are taken in front/back pairs as produced by create_signature. Backs are mirrored across the
+    press sheet so each front lines up with its back when the sheet is turned over.
+
+    Returns
+    -------
+    tuple[PdfWriter, int]
+        The ganged press sheets and the number of press sheets saved over printing each sheet separately.
+    """
+    items = [(b.pages[i], b.pages[i + 1]) for b in booklets for i in range(0, len(b.pages), 2)]
+    item_sizes = [(float(front.mediabox.width), float(front.mediabox.height)) for front, _ in items]
+    layout = plan_gang_layout(item_sizes, sheet_size, mm_to_pnt(gutter_mm))
+
+    if progress_bar is not None:
+        progress_bar.SetValue(0)
+        progress_bar.SetRange(len(layout))
+
+    writer = PdfWriter()
+    for placements in layout:
+        writer.add_blank_page(sheet_size.width, sheet_size.height)
+        front_page = writer.pages[-1]
+        writer.add_blank_page(sheet_size.width, sheet_size.height)
+        back_page = writer.pages[-1]
+        for index, x, y in placements:
+            front, back = items[index]
+            back_x = sheet_size.width - x - item_sizes[index][0]
+            front_page.merge_transformed_page(front, Transformation().translate(x, y))
+            back_page.merge_transformed_page(back, Transformation().translate(back_x, y))
+        if marks:
+            for page, mirrored in ((front_page, False), (back_page, True)):
+                marks.stamp(writer, page, [
+                    (sheet_size.width - x - item_sizes[i][0] if mirrored else x, y,
+                     sheet_size.width - x if mirrored else x + item_sizes[i][0], y + item_sizes[i][1])
+                    for i, x, y in placements
+                ])
 
         if progress_bar is not None:
             progress_bar.SetValue(progress_bar.GetValue() + 1)
             wx.Yield()
 
-    return writer
+    sheets_saved = len(items) - len(layout)
+    logging.info(f"Ganged {len(items)} sheets onto {len(layout)} press sheets, saving {sheets_saved}")
+    return writer, sheets_saved
+
+
+def part_document_id(document_id: Optional[bytes], part: str) -> Optional[bytes]:
+    """Derive the /ID of one file of a job written as several, e.g. "volume_2", so no two of its files share one."""
+    if document_id is None:
+        return None
+    return hashlib.sha1(document_id + b"/" + part.encode()).hexdigest()[:len(document_id)].encode()
+
+
+def write_pdf(writer: PdfWriter, fh: BinaryIO, linearize: bool = False, document_id: Optional[bytes] = None):
+    """
+    Write a document to fh, optionally linearised for print RIPs and web viewers.
+
+    Linearised output is rewritten through qpdf with compressed object and xref streams and objects ordered page by
+    page, so the first sheets can be read before the rest of the file has arrived.
+
+    Given a document_id it is written as both parts of the file's /ID, and qpdf is asked for an /ID derived from the
+    content rather than a random one, so repeated runs of a job write the same bytes.
+    """
+    # Merging two pages onto a sheet leaves the content stream of the first merge orphaned
+    writer.compress_identical_objects(remove_identicals=False, remove_orphans=True)
+    if document_id is not None:
+        writer._ID = ArrayObject([ByteStringObject(document_id), ByteStringObject(document_id)])
+    if not linearize:
+        writer.write(fh if fh.seekable() else _PositionCounter(fh))
+        return
+
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    buffer.seek(0)
+    linearize_pdf(buffer, fh, deterministic=document_id is not None)
+
+
+def linearize_pdf(source: BinaryIO, fh: BinaryIO, deterministic: bool = False):
+    """Rewrite the PDF read from source to fh through qpdf, linearised and with compressed object streams."""
+    with pikepdf.open(source) as pdf:
+        pdf.save(
+            fh,
+            linearize=True,
+            object_stream_mode=pikepdf.ObjectStreamMode.generate,
+            compress_streams=True,
+            deterministic_id=deterministic
+        )
+
+
+def embedded_font_sizes(doc: pymupdf.Document) -> dict[int, tuple[str, int]]:
+    """Map the xref of each font program embedded in doc to its base name and size in bytes."""
+    fonts: dict[int, tuple[str, int]] = {}
+    for page_index in range(doc.page_count):
+        for xref, _, _, base_name, *_ in doc.get_page_fonts(page_index, full=True):
+            if xref in fonts:
+                continue
+            _, _, _, buffer = doc.extract_font(xref)
+            if buffer:
+                fonts[xref] = (base_name, len(buffer))
+    return fonts
+
+
+def subset_pdf_fonts(
+        pdf_path: str,
+        linearize: bool = False,
+        document_id: Optional[bytes] = None
+) -> dict[str, tuple[int, int]]:
+    """
+    Subset every embedded font of a written PDF to the glyphs its pages use, replacing the file in place.
+
+    Runs in a worker process. The file's /ID is kept, and it is linearised again if it was before.
+
+    Returns
+    -------
+    dict[str, tuple[int, int]]
+        The size in bytes of each font program before and after subsetting, by base name.
+    """
+    with pymupdf.open(pdf_path) as doc:
+        before = embedded_font_sizes(doc)
+        doc.subset_fonts()
+        data = doc.tobytes(garbage=1, deflate=True, deflate_fonts=True, no_new_id=True)
+    with pymupdf.open("pdf", data) as doc:
+        after = embedded_font_sizes(doc)
+
+    # Fonts MuPDF couldn't subset come out as they went in, so only replace the file when it is smaller
+    if len(data) < Path(pdf_path).stat().st_size:
+        temp_path = Path(pdf_path).with_suffix(".subset.tmp")
+        with open(temp_path, "bw") as fh:
+            if linearize:
+                linearize_pdf(io.BytesIO(data), fh, deterministic=document_id is not None)
+            else:
+                fh.write(data)
+        os.replace(temp_path, pdf_path)
+    else:
+        after = before
+
+    savings: dict[str, tuple[int, int]] = {}
+    for xref, (name, size) in before.items():
+        # Subset fonts are renamed with a tag, e.g. ABCDEF+Name, so match them up by xref
+        new_size = after.get(xref, (name, 0))[1]
+        old_total, new_total = savings.get(name, (0, 0))
+        savings[name] = (old_total + size, new_total + new_size)
+    return savings
+
+
+def subset_output_fonts(
+        pdf_paths: list[Union[str, Path]],
+        linearize: bool = False,
+        document_id: Optional[bytes] = None,
+        workers: Optional[int] = None,
+        progress_bar: Optional[wx.Gauge] = None
+) -> tuple[int, int]:
+    """
+    Subset the embedded fonts of each output file to the glyphs the imposed sheets actually use.
+
+    MuPDF subsets all of a document's fonts in one pass, so the work is spread over a pool of processes one output
+    file at a time; split volumes and separately saved signatures are subset in parallel.
+
+    Returns
+    -------
+    tuple[int, int]
+        The total size of the output files in bytes before and after subsetting.
+    """
+    if len(pdf_paths) == 0:
+        return 0, 0
+    if progress_bar is not None:
+        progress_bar.SetValue(0)
+        progress_bar.SetRange(len(pdf_paths))
+
+    size_before = sum(Path(path).stat().st_size for path in pdf_paths)
+    savings: dict[str, tuple[int, int]] = {}
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=min(workers, len(pdf_paths))) as executor:
+        futures = [executor.submit(subset_pdf_fonts, str(path), linearize, document_id) for path in pdf_paths]
+        for future in as_completed(futures):
+            for name, (old_size, new_size) in future.result().items():
+                old_total, new_total = savings.get(name, (0, 0))
+                savings[name] = (old_total + old_size, new_total + new_size)
+            if progress_bar is not None:
+                progress_bar.SetValue(progress_bar.GetValue() + 1)
+                wx.Yield()
+
+    for name, (old_size, new_size) in sorted(savings.items()):
+        logging.debug(f"Font {name}: {old_size} -> {new_size} bytes")
+    size_after = sum(Path(path).stat().st_size for path in pdf_paths)
+    logging.info(
+        f"Subset {len(savings)} fonts in {len(pdf_paths)} files in {time.perf_counter() - start:.2f}s, "
+        f"{size_before} -> {size_after} bytes"
+    )
+    return size_before, size_after
+
+
+class _PositionCounter(io.RawIOBase):
+    """Counts the bytes written to a stream that can't tell(), like a pipe, as pypdf tells to find object offsets."""
+
+    def __init__(self, fh: BinaryIO):
+        super().__init__()
+        self.fh = fh
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: bytes) -> int:
+        self.position += len(data)
+        return self.fh.write(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def seekable(self) -> bool:
+        return False
+
+    def flush(self):
+        self.fh.flush()
+
+
+def impose_stream(
+        source: BinaryIO,
+        destination: BinaryIO,
+        page_selection: Optional[str] = None,
+        num_signatures: Optional[int] = None,
+        add_side_lines: bool = False,
+        double_up_height_mm: Optional[float] = None,
+        linearize: bool = False,
+        padding: str = "end",
+        blank_after: Optional[str] = None,
+        history: Optional[JobHistory] = None
+) -> list[int]:
+    """
+    Impose a whole job from one stream to another, for shell and spooler pipelines.
+
+    Nothing is written to disk: piped input is spooled as open_stream, each signature is imposed as it is written
+    and the output is written straight to destination, which needn't be seekable. The selection is padded to a
+    multiple of 4 pages as pad_page_selection, with blank_after as for parse_blank_positions. Given a history, the
+    job is recorded in it.
+
+    Returns
+    -------
+    list[int]
+        The signature sizes used, from calc_signature_sizes.
+    """
+    job_start = time.perf_counter()
+    timer = StageTimer()
+    memory = PeakMemoryMonitor()
+    if history is not None:
+        memory.start()
+    with timer.stage("read"):
+        reader = open_stream(source)
+    try:
+        if page_selection:
+            pages = parse_page_selection(page_selection, reader.get_num_pages())
+        else:
+            pages = list(range(reader.get_num_pages()))
+        after_pages = parse_blank_positions(blank_after, len(pages)) if blank_after else None
+        pages = pad_page_selection(pages, padding, after_pages)
+        subset = reader.subset(pages)
+        if add_side_lines:
+            with timer.stage("lines"):
+                subset = add_lines_to_last_page(subset)
+
+        signature_sizes = calc_signature_sizes(len(pages), num_signatures or get_ideal_num_sigs(len(pages)))
+        writer = PdfWriter()
+        resource_pool = ResourcePool()
+        output = _PositionCounter(destination)
+        with timer.stage("write"):
+            for signature in impose_signatures(
+                    subset, signature_sizes, double_up_height_mm=double_up_height_mm, timer=timer
+            ):
+                for page in signature.pages:
+                    resource_pool.insert_page(writer, page)
+            write_pdf(writer, output, linearize=linearize)
+            output.flush()
+        logging.info(
+            f"Imposed {len(pages)} pages, {pages.count(None)} of them blank, as signatures of {signature_sizes} sheets"
+        )
+
+        if history is not None:
+            with timer.stage("fingerprint_input"):
+                input_hash = fingerprint_input(reader).hexdigest()
+            history.record(
+                input_hash=input_hash,
+                num_pages=len(pages),
+                options={
+                    'add_side_lines': add_side_lines,
+                    'double_up_height': double_up_height_mm,
+                    'blank_pages': pages.count(None),
+                    'linearize_output': linearize,
+                    'headless': True
+                },
+                signature_sizes=signature_sizes,
+                stage_seconds=timer.seconds,
+                total_seconds=time.perf_counter() - job_start,
+                output_bytes=output.position,
+                peak_memory_bytes=memory.stop()
+            )
+        return signature_sizes
+    finally:
+        reader.close()
+
+
+def render_proof_chunk(pdf_path: str, page_indexes: list[int], dpi: int, output_dir: str) -> list[str]:
+    """Render some pages of a PDF to PNG in a worker process, holding only one page's pixmap at a time."""
+    paths: list[str] = []
+    with pymupdf.open(pdf_path) as doc:
+        for index in page_indexes:
+            pixmap = doc.load_page(index).get_pixmap(dpi=dpi)
+            paths.append(str(Path(output_dir) / f"sheet_{index + 1:04d}.png"))
+            pixmap.save(paths[-1])
+            del pixmap
+            pymupdf.TOOLS.store_shrink(100)
+    return paths
+
+
+def render_proofs(
+        pdf_path: Union[str, Path],
+        output_dir: Path,
+        dpi: int = 72,
+        contact_sheet: bool = False,
+        workers: Optional[int] = None,
+        progress_bar: Optional[wx.Gauge] = None
+) -> list[Path]:
+    """
+    Render every sheet of an imposed PDF to PNG for proofing.
+
+    Pages are split into contiguous chunks, several per worker so a slow chunk doesn't hold up the rest, and
+    rendered by a pool of processes that each open the PDF themselves.
+
+    Returns
+    -------
+    list[Path]
+        The rendered sheets in order, followed by the contact sheet if one was made.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    with pymupdf.open(pdf_path) as doc:
+        num_pages = doc.page_count
+    if num_pages == 0:
+        return []
+
+    workers = workers or os.cpu_count() or 1
+    chunk_size = ceil(num_pages / (workers * PROOF_CHUNKS_PER_WORKER))
+    chunks = [list(range(i, min(i + chunk_size, num_pages))) for i in range(0, num_pages, chunk_size)]
+    if progress_bar is not None:
+        progress_bar.SetValue(0)
+        progress_bar.SetRange(len(chunks))
+
+    paths: list[str] = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+        futures = [executor.submit(render_proof_chunk, str(pdf_path), chunk, dpi, str(output_dir)) for chunk in chunks]
+        for future in as_completed(futures):
+            paths.extend(future.result())
+            if progress_bar is not None:
+                progress_bar.SetValue(progress_bar.GetValue() + 1)
+                wx.Yield()
+    logging.info(f"Rendered {num_pages} proofs at {dpi}dpi in {time.perf_counter() - start:.2f}s")
+
+    proofs = [Path(p) for p in sorted(paths)]
+    if contact_sheet:
+        proofs.append(create_contact_sheet(proofs, output_dir / "contact_sheet.png"))
+    return proofs
+
+
+def create_contact_sheet(image_paths: list[Path], output_path: Path) -> Path:
+    """Lay out numbered thumbnails of rendered sheets in a grid and save it as one PNG."""
+    first = pymupdf.Pixmap(str(image_paths[0]))
+    thumb_width = PROOF_THUMBNAIL_WIDTH
+    thumb_height = thumb_width * first.height / first.width
+    columns = min(PROOF_CONTACT_SHEET_COLUMNS, len(image_paths))
+    rows = ceil(len(image_paths) / columns)
+
+    with pymupdf.open() as doc:
+        page = doc.new_page(width=columns * thumb_width, height=rows * thumb_height)
+        for i, path in enumerate(image_paths):
+            x = (i % columns) * thumb_width
+            y = (i // columns) * thumb_height
+            page.insert_image(pymupdf.Rect(x, y, x + thumb_width, y + thumb_height), filename=str(path))
+            page.draw_rect(pymupdf.Rect(x, y, x + thumb_width, y + thumb_height), color=(0.6, 0.6, 0.6), width=0.5)
+            page.insert_text((x + 4, y + 12), str(i + 1), fontsize=10, color=(1, 0, 0))
+        page.get_pixmap(dpi=72).save(str(output_path))
+    return output_path
 
 
 def mm_to_pnt(mm: float) -> float:
@@ -645,6 +3563,82 @@ def calc_signature_page_ranges(signature_sizes: list[int]) -> list[tuple[int, in
 
 def main():
     logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(levelname)-8s %(message)s')
+
+    parser = argparse.ArgumentParser(description="Louis' Book Formatter")
+    parser.add_argument(
+        "--preflight", metavar="PDF", help="print a preflight report for PDF, or a directory of page images, and exit"
+    )
+    parser.add_argument("--pages", help="page selection, e.g. '1-16, 33-48, 101-'")
+    parser.add_argument("--add-lines", action="store_true", help="add trim lines to the last page")
+    parser.add_argument("--double-up", type=float, metavar="HEIGHT_MM", help="double up pages at this height")
+    parser.add_argument(
+        "--impose", metavar="PDF", help="impose PDF, or '-' to read it from stdin, to --output without the window"
+    )
+    parser.add_argument(
+        "--output", metavar="PDF", default="-", help="where --impose writes the imposed PDF, '-' for stdout (default)"
+    )
+    parser.add_argument(
+        "--pad", choices=list(PADDING_MODES), default="end", help="where blank pages go to make a multiple of 4 pages"
+    )
+    parser.add_argument("--blank-after", metavar="PAGES", help="with --pad after_pages, pages to put a blank after")
+    parser.add_argument("--signatures", type=int, help="number of signatures, by default as few as fit the pages")
+    parser.add_argument("--linearize", action="store_true", help="linearise the imposed PDF")
+    parser.add_argument(
+        "--record-history",
+        action="store_true",
+        help=f"record the --impose job in {HISTORY_PATH.name}, as the window does"
+    )
+    parser.add_argument(
+        "--history", type=int, nargs="?", const=20, metavar="N",
+        help="print the last N jobs run (20) and the throughput of each stage by library versions, and exit"
+    )
+    parser.add_argument("--proof", metavar="PDF", help="render every sheet of an imposed PDF to PNG and exit")
+    parser.add_argument("--dpi", type=int, default=72, help="resolution of rendered proofs")
+    parser.add_argument("--contact-sheet", action="store_true", help="also render proofs onto one contact sheet")
+    args = parser.parse_args()
+
+    if args.proof:
+        output_dir = Path(args.proof).with_name(Path(args.proof).stem + "_proofs")
+        for path in render_proofs(args.proof, output_dir, dpi=args.dpi, contact_sheet=args.contact_sheet):
+            print(path)
+        return
+
+    if args.history is not None:
+        print(JobHistory().report(args.history))
+        return
+
+    if args.impose:
+        try:
+            with (
+                sys.stdin.buffer if args.impose == "-" else open(args.impose, "rb") as source,
+                sys.stdout.buffer if args.output == "-" else open(args.output, "wb") as destination
+            ):
+                impose_stream(
+                    source,
+                    destination,
+                    page_selection=args.pages,
+                    num_signatures=args.signatures,
+                    add_side_lines=args.add_lines,
+                    double_up_height_mm=args.double_up,
+                    linearize=args.linearize,
+                    padding=args.pad,
+                    blank_after=args.blank_after,
+                    history=JobHistory() if args.record_history else None
+                )
+        except (ValueError, PyPdfError) as e:
+            parser.error(str(e))
+        return
+
+    if args.preflight:
+        document = open_input(args.preflight)
+        num_pages = document.get_num_pages()
+        document.close()
+        pages = parse_page_selection(args.pages, num_pages) if args.pages else list(range(num_pages))
+        after_pages = parse_blank_positions(args.blank_after, len(pages)) if args.blank_after else None
+        report = preflight(args.preflight, pad_page_selection(pages, args.pad, after_pages))
+        print(format_preflight(report, estimate_job_cost(report, args.add_lines, args.double_up)))
+        return
+
     app = wx.App()
     frm = MainWindow(None, title="Louis' Book Formatter - 2.0.0")
     frm.Show()
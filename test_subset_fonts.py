@@ -0,0 +1,39 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import pymupdf
+
+import new
+
+HANDBOOK_PATH = Path(__file__).parent / "handbook.pdf"
+RENDER_DPI = 72
+
+
+def render_pages(pdf_path: Path) -> list[bytes]:
+    with pymupdf.open(pdf_path) as doc:
+        return [page.get_pixmap(dpi=RENDER_DPI).samples for page in doc]
+
+
+class SubsetFontsTest(unittest.TestCase):
+    def test_subsetting_leaves_rendering_unchanged(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_path = Path(temp_dir) / "imposed.pdf"
+            reader = new.SubsetReader(HANDBOOK_PATH, list(range(16)))
+            signature = new.create_signature(reader, new.get_signature_page_indexes([4])[0])
+            with output_path.open("bw") as fh:
+                new.write_pdf(signature, fh)
+            reader.close()
+
+            before = render_pages(output_path)
+            size_before, size_after = new.subset_output_fonts([output_path], workers=1)
+            after = render_pages(output_path)
+
+        self.assertLess(size_after, size_before)
+        self.assertEqual(len(before), len(after))
+        for sheet, (before_samples, after_samples) in enumerate(zip(before, after)):
+            self.assertEqual(before_samples, after_samples, f"Sheet side {sheet} renders differently")
+
+
+if __name__ == '__main__':
+    unittest.main()